@@ -43,6 +43,12 @@ CREATE TABLE reviews (
 	)
 ;
 
+CREATE INDEX reviews_coffee_id_review_date ON reviews(coffee_id, review_date);
+CREATE INDEX coffees_roast_id ON coffees(roast_id);
+
+-- Schema version for migrations.py
+PRAGMA user_version = 1;
+
 INSERT INTO reviews (coffee_id, reviewer, review_date, review) VALUES
     (1, 'Maxwell', '2019-02-01', 'Acidic but uneventful, best consumed with large amounts of sugar and a pastry.'),
     (1, 'Peet', '2019-02-23', 'Bright and warm, a perfect companion to breakfast or any meal.'),
@@ -1,9 +1,203 @@
 import sys
+from collections import deque, namedtuple
 from PyQt5 import QtWidgets as qtw
 from PyQt5 import QtCore as qtc
 from PyQt5 import QtGui as qtg
 from PyQt5 import QtSql as qts
 
+import migrations
+import sql_profiler
+from connection_pool import ConnectionPool
+from db_worker import DbWorker
+
+
+Coffee = namedtuple('Coffee', 'id coffee_brand coffee_name roast reviews')
+Review = namedtuple('Review', 'reviewer review_date review')
+
+
+class CoffeeLoader:
+    """Loads a coffee with its roast and reviews in one query
+
+    The query runs on the worker, which prepares it once and reuses
+    it for every coffee.  Each result row repeats the coffee columns
+    next to one review; they become a single Coffee record holding a
+    list of Review records.
+    """
+
+    sql = (
+        'SELECT coffees.id, coffee_brand, coffee_name, roasts.description, '
+        'reviews.id, reviewer, review_date, review '
+        'FROM coffees '
+        'LEFT JOIN roasts ON roasts.id = coffees.roast_id '
+        'LEFT JOIN reviews ON reviews.coffee_id = coffees.id '
+        'WHERE coffees.id = :id')
+
+    def __init__(self, worker):
+        self.worker = worker
+
+    def load(self, coffee_id, callback):
+        """Call callback with the Coffee, or None if there is none"""
+        self.worker.submit(
+            self.sql, {':id': coffee_id},
+            lambda rows: callback(self.coffee(rows)))
+
+    @staticmethod
+    def coffee(rows):
+        if not rows:
+            return None
+        # A coffee without reviews still gives one row, with a null
+        # (which QSQLITE hands back as '') instead of a review id
+        reviews = [Review._make(row[5:]) for row in rows if row[4]]
+        return Coffee(*rows[0][:4], reviews)
+
+
+class ReviewTableModel(qtc.QAbstractTableModel):
+    """A read-only table over a list of review tuples
+
+    The tuples are shown as they are; nothing is copied into items.
+    """
+
+    headers = ['Reviewer', 'Date', 'Review']
+
+    def __init__(self):
+        super().__init__()
+        self._reviews = []
+
+    def set_reviews(self, reviews):
+        self.beginResetModel()
+        self._reviews = reviews
+        self.endResetModel()
+
+    def rowCount(self, parent=qtc.QModelIndex()):
+        return 0 if parent.isValid() else len(self._reviews)
+
+    def columnCount(self, parent=qtc.QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=qtc.Qt.DisplayRole):
+        if index.isValid() and role == qtc.Qt.DisplayRole:
+            return self._reviews[index.row()][index.column()]
+
+    def headerData(self, section, orientation, role=qtc.Qt.DisplayRole):
+        if orientation == qtc.Qt.Horizontal and role == qtc.Qt.DisplayRole:
+            return self.headers[section]
+        return super().headerData(section, orientation, role)
+
+
+class CoffeeCursorModel(qtc.QAbstractTableModel):
+    """The coffees list, read through forward-only cursors
+
+    The row count comes from one COUNT(*) up front, so the scroll bar
+    is right from the start.  Only a ring of at most max_rows rows
+    around what the view asked for last is kept.  Scrolling past
+    either end of the ring reads the next block_size rows by id
+    (keyset) and drops as many from the other end; a jump elsewhere
+    reads a fresh block with OFFSET.  Memory stays the same however
+    far the list is scrolled.
+    """
+
+    block_size = 200
+    max_rows = 2000
+    columns = 'id, coffee_brand, coffee_name'
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self._headers = ['id', 'coffee_brand', 'coffee']
+        self._after_query = self._prepare(
+            f'SELECT {self.columns} FROM coffees WHERE id > :id '
+            'ORDER BY id LIMIT :count')
+        self._before_query = self._prepare(
+            f'SELECT {self.columns} FROM coffees WHERE id < :id '
+            'ORDER BY id DESC LIMIT :count')
+        self._offset_query = self._prepare(
+            f'SELECT {self.columns} FROM coffees '
+            'ORDER BY id LIMIT :count OFFSET :offset')
+        self._count = 0
+        self._rows = deque(maxlen=self.max_rows)
+        self._first = 0
+
+    def _prepare(self, sql):
+        query = qts.QSqlQuery(self.db)
+        query.setForwardOnly(True)
+        query.prepare(sql)
+        return query
+
+    def _fetch(self, query, **params):
+        for name, value in params.items():
+            query.bindValue(f':{name}', value)
+        rows = []
+        if query.exec():
+            while query.next():
+                rows.append((query.value(0), query.value(1), query.value(2)))
+        else:
+            print(f'Select failed: {query.lastError().text()}')
+        query.finish()
+        return rows
+
+    def select(self):
+        query = qts.QSqlQuery('SELECT count(*) FROM coffees', self.db)
+        self.beginResetModel()
+        self._count = query.value(0) if query.next() else 0
+        self._rows.clear()
+        self._first = 0
+        self.endResetModel()
+
+    def _load(self, row):
+        """Make sure row is in the ring"""
+        first = self._first
+        last = first + len(self._rows)
+        if first <= row < last:
+            return
+        if self._rows and last <= row < last + self.block_size:
+            # the ring drops rows from the left as these go in
+            rows = self._fetch(
+                self._after_query, id=self._rows[-1][0],
+                count=self.block_size)
+            self._rows.extend(rows)
+            self._first = last + len(rows) - len(self._rows)
+        elif self._rows and first - self.block_size <= row < first:
+            # newest first, which extendleft() turns back around
+            rows = self._fetch(
+                self._before_query, id=self._rows[0][0],
+                count=self.block_size)
+            self._rows.extendleft(rows)
+            self._first = first - len(rows)
+        else:
+            self._first = max(0, row - self.block_size // 2)
+            self._rows = deque(
+                self._fetch(
+                    self._offset_query, offset=self._first,
+                    count=self.block_size),
+                maxlen=self.max_rows)
+
+    def rowCount(self, parent=qtc.QModelIndex()):
+        return 0 if parent.isValid() else self._count
+
+    def columnCount(self, parent=qtc.QModelIndex()):
+        return 0 if parent.isValid() else len(self._headers)
+
+    def data(self, index, role=qtc.Qt.DisplayRole):
+        if not index.isValid() or role != qtc.Qt.DisplayRole:
+            return None
+        self._load(index.row())
+        offset = index.row() - self._first
+        if 0 <= offset < len(self._rows):
+            return self._rows[offset][index.column()]
+
+    def headerData(self, section, orientation, role=qtc.Qt.DisplayRole):
+        if orientation == qtc.Qt.Horizontal and role == qtc.Qt.DisplayRole:
+            return self._headers[section]
+        return super().headerData(section, orientation, role)
+
+    def setHeaderData(self, section, orientation, value,
+                      role=qtc.Qt.EditRole):
+        if orientation != qtc.Qt.Horizontal:
+            return False
+        self._headers[section] = value
+        self.headerDataChanged.emit(orientation, section, section)
+        return True
+
 
 class CoffeeForm(qtw.QWidget):
     """Form to display/edit all info about a coffee"""
@@ -19,22 +213,17 @@ class CoffeeForm(qtw.QWidget):
         self.roast = qtw.QComboBox()
         self.roast.addItems(roasts)
         self.layout().addRow('Roast: ', self.roast)
-        self.reviews = qtw.QTableWidget(columnCount=3)
+        self.reviews = qtw.QTableView()
+        self.reviews.setModel(ReviewTableModel())
         self.reviews.horizontalHeader().setSectionResizeMode(
             2, qtw.QHeaderView.Stretch)
         self.layout().addRow(self.reviews)
 
-    def show_coffee(self, coffee_data, reviews):
-        self.coffee_brand.setText(coffee_data.get('coffee_brand'))
-        self.coffee_name.setText(coffee_data.get('coffee_name'))
-        self.roast.setCurrentIndex(coffee_data.get('roast_id'))
-        self.reviews.clear()
-        self.reviews.setHorizontalHeaderLabels(
-            ['Reviewer', 'Date', 'Review'])
-        self.reviews.setRowCount(len(reviews))
-        for i, review in enumerate(reviews):
-            for j, value in enumerate(review):
-                self.reviews.setItem(i, j, qtw.QTableWidgetItem(value))
+    def show_coffee(self, coffee):
+        self.coffee_brand.setText(coffee.coffee_brand)
+        self.coffee_name.setText(coffee.coffee_name)
+        self.roast.setCurrentIndex(self.roast.findText(coffee.roast or ''))
+        self.reviews.model().set_reviews(coffee.reviews)
 
 
 class MainWindow(qtw.QMainWindow):
@@ -51,9 +240,15 @@ class MainWindow(qtw.QMainWindow):
         self.setCentralWidget(self.stack)
 
         # Connect to the database
-        self.db = qts.QSqlDatabase.addDatabase('QSQLITE')
-        self.db.setDatabaseName('coffee.db')
-        if not self.db.open():
+        self.pool = ConnectionPool('coffee.db')
+        # Opt-in SQL profiling, see sql_profiler.py
+        self.profiler = sql_profiler.from_environment(self.pool)
+        if self.profiler:
+            self.addDockWidget(
+                qtc.Qt.BottomDockWidgetArea,
+                sql_profiler.SqlProfilerPanel(self.profiler, parent=self))
+        self.db = self.pool.connection()
+        if not self.db.isOpen():
             error = self.db.lastError().text()
             qtw.QMessageBox.critical(
                 None, 'DB Connection Error',
@@ -61,16 +256,28 @@ class MainWindow(qtw.QMainWindow):
                 f'{error}')
             sys.exit(1)
 
-        # Check for missing tables
-        required_tables = {'roasts', 'coffees', 'reviews'}
-        tables = self.db.tables()
-        missing_tables = required_tables - set(tables)
-        if missing_tables:
-            qtw.QMessageBox.critica(
-                None, 'DB Integrity Error'
-                'Missing tables, please repair DB: '
-                f'{missing_tables}')
+        # Bring the schema up to date, then check it
+        # A failed migration leaves objects missing, so its error goes
+        # first: it says why
+        error = migrations.migrate(self.db)
+        if error:
+            qtw.QMessageBox.critical(None, 'DB Migration Error', error)
             sys.exit(1)
+        missing = migrations.check_schema(self.db)
+        if missing:
+            qtw.QMessageBox.critical(
+                None, 'DB Integrity Error',
+                'Missing tables or indexes, please repair DB: '
+                f'{missing}')
+            sys.exit(1)
+
+        # Queries for the form run on a worker thread
+        self.worker = DbWorker(self.pool, parent=self)
+        self.busy = qtw.QProgressBar(maximum=0, maximumWidth=100)
+        self.busy.hide()
+        self.statusBar().addPermanentWidget(self.busy)
+        self.worker.busy.connect(self.busy.setVisible)
+        self.loader = CoffeeLoader(self.worker)
 
         # Make a query
         query = self.db.exec('SELECT count(*) FROM coffees')
@@ -88,11 +295,9 @@ class MainWindow(qtw.QMainWindow):
         self.coffee_form = CoffeeForm(roasts)
         self.stack.addWidget(self.coffee_form)
 
-        # Retreive the coffees table using a QSqlQueryModel
-        coffees = qts.QSqlQueryModel()
-        coffees.setQuery(
-            "SELECT id, coffee_brand, coffee_name AS coffee "
-            "FROM coffees ORDER BY id")
+        # Retreive the coffees table a window of rows at a time
+        coffees = CoffeeCursorModel(self.db)
+        coffees.select()
         self.coffee_list = qtw.QTableView()
         self.coffee_list.setModel(coffees)
         self.stack.addWidget(self.coffee_list)
@@ -119,34 +324,18 @@ class MainWindow(qtw.QMainWindow):
         return coffee_id
 
     def show_coffee(self, coffee_id):
-        # get the basic coffee information
-        query1 = qts.QSqlQuery(self.db)
-        query1.prepare('SELECT * FROM coffees WHERE id=:id')
-        query1.bindValue(':id', coffee_id)
-        query1.exec()
-        query1.next()
-        coffee = {
-            'id': query1.value(0),
-            'coffee_brand': query1.value(1),
-            'coffee_name': query1.value(2),
-            'roast_id': query1.value(3)
-        }
-        # get the reviews
-        query2 = qts.QSqlQuery()
-        query2.prepare('SELECT * FROM reviews WHERE coffee_id=:id')
-        query2.bindValue(':id', coffee_id)
-        query2.exec()
-        reviews = []
-        while query2.next():
-            reviews.append((
-                query2.value('reviewer'),
-                query2.value('review_date'),
-                query2.value('review')
-            ))
-
-        self.coffee_form.show_coffee(coffee, reviews)
+        self.loader.load(coffee_id, self.got_coffee)
+
+    def got_coffee(self, coffee):
+        if coffee is None:
+            return
+        self.coffee_form.show_coffee(coffee)
         self.stack.setCurrentWidget(self.coffee_form)
 
+    def closeEvent(self, event):
+        self.worker.stop()
+        super().closeEvent(event)
+
 
 if __name__ == '__main__':
     app = qtw.QApplication(sys.argv)
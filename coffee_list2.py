@@ -1,9 +1,21 @@
 import sys
+import csv
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import islice
 from PyQt5 import QtWidgets as qtw
 from PyQt5 import QtCore as qtc
 from PyQt5 import QtGui as qtg
 from PyQt5 import QtSql as qts
 
+import migrations
+import sql_profiler
+from connection_pool import ConnectionPool
+from db_worker import DbWorker
+from lookup_cache import lookup_table
+
 
 """
 TODO:
@@ -22,6 +34,787 @@ class DateDelegate(qtw.QStyledItemDelegate):
         return date_inp
 
 
+def delete_in(db, table, column, values, chunk_size=500):
+    """DELETE the rows of table whose column is one of values
+
+    Values are bound as parameters, chunk_size at a time to stay under
+    SQLite's limit on host parameters.  The caller owns the transaction.
+    """
+    values = list(values)
+    for start in range(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size]
+        query = qts.QSqlQuery(db)
+        query.prepare(
+            f'DELETE FROM {table} WHERE {column} IN '
+            f'({", ".join("?" * len(chunk))})')
+        for value in chunk:
+            query.addBindValue(value)
+        if not query.exec():
+            print(f'Delete failed: {query.lastError().text()}')
+            return False
+    return True
+
+
+def insert_reviews(db, rows, batch_size=10000, progress=None, stop=None):
+    """Insert (coffee_id, reviewer, review_date, review) rows into reviews
+
+    rows can be any iterable and is consumed batch_size rows at a time.
+    Each batch is bound column-wise to one prepared statement, run with
+    execBatch() and committed in its own transaction.  progress, if
+    given, is called with the number of rows inserted so far after each
+    batch; stop, if given, is checked before each one and ends the
+    import when it returns True.  Returns the number of rows inserted
+    and an error message, empty on success; on an error the failed
+    batch is rolled back and the import stops.
+    """
+    query = qts.QSqlQuery(db)
+    query.prepare(
+        'INSERT INTO reviews(coffee_id, reviewer, review_date, review) '
+        'VALUES (?, ?, ?, ?)')
+    rows = iter(rows)
+    inserted = 0
+    while stop is None or not stop():
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        for column in zip(*batch):
+            query.addBindValue(list(column))
+        db.transaction()
+        if not query.execBatch():
+            error = query.lastError().text()
+            db.rollback()
+            return inserted, f'Insert failed: {error}'
+        db.commit()
+        inserted += len(batch)
+        if progress is not None:
+            progress(inserted)
+    return inserted, ''
+
+
+def read_reviews_csv(fh, bad_rows=None):
+    """Yield review rows from a CSV file with a header row
+
+    The columns are coffee_id, reviewer, review_date and review; a
+    missing review_date means today.  Rows that can't be read are
+    skipped, and (line number, problem) appended to bad_rows if given.
+    A ValueError is raised if a column is missing from the header.
+    """
+    today = qtc.QDate.currentDate().toString(qtc.Qt.ISODate)
+    reader = csv.DictReader(fh)
+    missing = {'coffee_id', 'reviewer', 'review'} - set(
+        reader.fieldnames or ())
+    if missing:
+        raise ValueError(
+            f'Missing columns in the header: {", ".join(sorted(missing))}')
+    for record in reader:
+        # DictReader fills short rows with None and files extra fields
+        # under None
+        if None in record or None in record.values():
+            problem = 'wrong number of fields'
+        else:
+            try:
+                coffee_id = int(record['coffee_id'])
+            except ValueError:
+                problem = f'coffee_id {record["coffee_id"]!r} is not a number'
+            else:
+                yield (
+                    coffee_id,
+                    record['reviewer'],
+                    record.get('review_date') or today,
+                    record['review'],
+                )
+                continue
+        if bad_rows is not None:
+            bad_rows.append((reader.line_num, problem))
+
+
+class ReviewImporter(qtc.QThread):
+    """Imports reviews from a CSV file on its own pooled connection
+
+    progress is emitted with the number of rows inserted after each
+    batch.  Once finished, inserted, bad_rows (see read_reviews_csv())
+    and error tell how it went; batches inserted before an error stay
+    committed.  requestInterruption() stops it after the current batch.
+    """
+
+    progress = qtc.pyqtSignal(int)
+
+    def __init__(self, pool, filename, parent=None):
+        super().__init__(parent)
+        self.pool = pool
+        self.filename = filename
+        self.inserted = 0
+        self.bad_rows = []
+        self.error = ''
+
+    def _batch_inserted(self, inserted):
+        self.inserted = inserted
+        self.progress.emit(inserted)
+
+    def run(self):
+        db = self.pool.connection()
+        try:
+            with open(self.filename, newline='', encoding='utf-8') as fh:
+                self.inserted, self.error = insert_reviews(
+                    db, read_reviews_csv(fh, self.bad_rows),
+                    progress=self._batch_inserted,
+                    stop=self.isInterruptionRequested)
+        except (OSError, ValueError, csv.Error) as e:
+            self.error = str(e)
+        # insert_reviews()'s query is gone, so the connection can go too
+        del db
+        self.pool.release()
+
+
+class CoffeeListModel(qtc.QAbstractTableModel):
+    """Coffees with their roast, read a page at a time
+
+    Only the coffee ids are read up front (from the rowid b-tree, eight
+    bytes a row); the other columns are fetched in pages of page_size
+    rows when the view asks for them, seeking to each page by id
+    (keyset pagination) rather than with OFFSET.  At most max_pages
+    pages are kept.
+
+    The columns and fieldIndex() match the QSqlRelationalTableModel
+    this replaces.  Pages hold the roast_id; its description (and, as
+    a decoration, its color) comes from the in-memory roasts table, so
+    painting never reads the roasts table.  New rows are kept aside
+    until they have a brand and a name, then inserted.  Given a
+    DbWorker, select() reads the ids on the worker's thread.
+
+    Edits to existing rows show at once but are written behind: they
+    are collected per coffee until no edit has come for write_delay
+    ms, then flushed as one UPDATE per coffee in a single transaction
+    (on the worker when there is one).  Each UPDATE only matches if the
+    edited columns still hold the values they had before the edit; if
+    someone else changed them first, the row is re-read and
+    write_failed is emitted instead.
+    """
+
+    write_failed = qtc.pyqtSignal(int, str)
+
+    fields = ['id', 'coffee_brand', 'coffee_name', 'description']
+    page_size = 256
+    max_pages = 32
+    write_delay = 300
+    ids_sql = 'SELECT id FROM coffees ORDER BY id'
+
+    def __init__(self, db=None, worker=None):
+        super().__init__()
+        self.db = db or qts.QSqlDatabase.database()
+        self.worker = worker
+        self._page_query = qts.QSqlQuery(self.db)
+        self._page_query.setForwardOnly(True)
+        self._page_query.prepare(
+            'SELECT id, coffee_brand, coffee_name, roast_id FROM coffees '
+            'WHERE id >= :first ORDER BY id LIMIT :count')
+        self._ids = array('q')
+        self._pages = OrderedDict()
+        self._new_rows = []
+        self.roasts = lookup_table(self.db, 'roasts', ['description', 'color'])
+        self.roasts.changed.connect(self._roasts_changed)
+        # {coffee id: {column: (old value, new value)}}, not yet sent,
+        # and the batches the worker has not answered yet
+        self._edits = {}
+        self._writing = []
+        self._write_timer = qtc.QTimer(
+            self, singleShot=True, interval=self.write_delay)
+        self._write_timer.timeout.connect(self.flush)
+
+    def _roasts_changed(self):
+        column = self.fieldIndex('description')
+        self.dataChanged.emit(
+            self.index(0, column), self.index(self.rowCount() - 1, column))
+
+    def select(self):
+        self.roasts.refresh()
+        if self.worker is not None:
+            self.worker.submit(
+                self.ids_sql,
+                callback=lambda rows: self._set_ids(row[0] for row in rows))
+            return True
+        query = qts.QSqlQuery(self.db)
+        query.setForwardOnly(True)
+        query.exec(self.ids_sql)
+        ids = array('q')
+        while query.next():
+            ids.append(query.value(0))
+        self._set_ids(ids)
+        return True
+
+    def _set_ids(self, ids):
+        self.beginResetModel()
+        self._ids = array('q', ids)
+        self._pages.clear()
+        self._new_rows.clear()
+        self.endResetModel()
+
+    def lastError(self):
+        return self._page_query.lastError()
+
+    def fieldIndex(self, name):
+        return self.fields.index(name) if name in self.fields else -1
+
+    def index_of(self, coffee_id, column=0):
+        """The index of the coffee with coffee_id, or an invalid index"""
+        row = bisect_left(self._ids, coffee_id)
+        if row < len(self._ids) and self._ids[row] == coffee_id:
+            return self.index(row, column)
+        return qtc.QModelIndex()
+
+    def _page(self, number):
+        page = self._pages.get(number)
+        if page is not None:
+            self._pages.move_to_end(number)
+            return page
+        first = number * self.page_size
+        count = min(self.page_size, len(self._ids) - first)
+        query = self._page_query
+        query.bindValue(':first', self._ids[first])
+        query.bindValue(':count', count)
+        page = []
+        if query.exec():
+            while query.next():
+                page.append([
+                    None if query.isNull(i) else query.value(i)
+                    for i in range(4)])
+        query.finish()
+        # Edits not written yet still show
+        for edits in self._writing + [self._edits]:
+            for row in page:
+                for column, (old, new) in edits.get(row[0], {}).items():
+                    row[column] = new
+        self._pages[number] = page
+        if len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return page
+
+    def _row(self, row):
+        if row >= len(self._ids):
+            return self._new_rows[row - len(self._ids)]
+        page = self._page(row // self.page_size)
+        offset = row % self.page_size
+        return page[offset] if offset < len(page) else [None] * 4
+
+    def rowCount(self, parent=qtc.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._ids) + len(self._new_rows)
+
+    def columnCount(self, parent=qtc.QModelIndex()):
+        return 0 if parent.isValid() else len(self.fields)
+
+    def data(self, index, role=qtc.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        value = self._row(index.row())[index.column()]
+        if index.column() == self.fieldIndex('description'):
+            if role in (qtc.Qt.DisplayRole, qtc.Qt.EditRole):
+                return self.roasts.value(value, 'description')
+            if role == qtc.Qt.DecorationRole:
+                color = self.roasts.value(value, 'color')
+                return qtg.QColor(color) if color else None
+        elif role in (qtc.Qt.DisplayRole, qtc.Qt.EditRole):
+            return value
+
+    def headerData(self, section, orientation, role=qtc.Qt.DisplayRole):
+        if orientation == qtc.Qt.Horizontal and role == qtc.Qt.DisplayRole:
+            return self.fields[section]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.column() != self.fieldIndex('id'):
+            flags |= qtc.Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=qtc.Qt.EditRole):
+        if not index.isValid() or role != qtc.Qt.EditRole:
+            return False
+        column = self.fields[index.column()]
+        row = self._row(index.row())
+        if column == 'description':
+            value = self.roasts.find('description', value)
+            if value is None:
+                return False
+            column = 'roast_id'
+        if row[0] is None:
+            row[index.column()] = value
+            if not self._insert_new_row(index.row(), row):
+                return True  # kept until the row is complete
+        elif value != row[index.column()]:
+            edits = self._edits.setdefault(row[0], {})
+            old = edits.get(index.column(), (row[index.column()],))[0]
+            edits[index.column()] = (old, value)
+            row[index.column()] = value
+            self._write_timer.start()
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def _sql_column(self, column):
+        return 'roast_id' if column == 3 else self.fields[column]
+
+    def flush(self):
+        """Write the edits waiting for the write_delay timer now"""
+        self._write_timer.stop()
+        if not self._edits:
+            return
+        edits, self._edits = self._edits, {}
+        statements = []
+        for coffee_id, columns in edits.items():
+            names = [self._sql_column(column) for column in columns]
+            assignments = ', '.join(f'{name} = ?' for name in names)
+            unchanged = ' AND '.join(f'{name} IS ?' for name in names)
+            statements.append((
+                f'UPDATE coffees SET {assignments} '
+                f'WHERE id = ? AND {unchanged}',
+                [new for old, new in columns.values()] + [coffee_id]
+                + [old for old, new in columns.values()]))
+        self._writing.append(edits)
+        if self.worker is not None:
+            self.worker.submit_transaction(
+                statements,
+                lambda counts: self._written(edits, counts),
+                lambda error: self._written(edits, [0] * len(edits), error))
+            return
+        self.db.transaction()
+        counts = []
+        for sql, params in statements:
+            query = qts.QSqlQuery(self.db)
+            query.prepare(sql)
+            for value in params:
+                query.addBindValue(value)
+            if not query.exec():
+                self.db.rollback()
+                self._written(edits, [0] * len(edits),
+                              query.lastError().text())
+                return
+            counts.append(query.numRowsAffected())
+        self.db.commit()
+        self._written(edits, counts)
+
+    def _written(self, edits, counts, error=''):
+        self._writing.remove(edits)
+        for coffee_id, count in zip(edits, counts):
+            if count:
+                continue
+            # Not written: show what the database holds now
+            index = self.index_of(coffee_id)
+            if index.isValid():
+                self._pages.pop(index.row() // self.page_size, None)
+                self.dataChanged.emit(index, index.siblingAtColumn(3))
+            self.write_failed.emit(
+                coffee_id, error or 'changed by someone else')
+
+    def _insert_new_row(self, view_row, row):
+        """Insert a pending row once it has a brand and a name"""
+        if not (row[1] and row[2]):
+            return False
+        query = qts.QSqlQuery(self.db)
+        query.prepare(
+            'INSERT INTO coffees(coffee_brand, coffee_name, roast_id) '
+            'VALUES (:brand, :name, :roast)')
+        query.bindValue(':brand', row[1])
+        query.bindValue(':name', row[2])
+        query.bindValue(':roast', row[3])
+        if not query.exec():
+            print(f'Insert failed: {query.lastError().text()}')
+            return False
+        row[0] = query.lastInsertId()
+        # Ids only grow, so the new row stays at the end of the id list
+        self._new_rows.remove(row)
+        self._ids.append(row[0])
+        self._pages.pop((len(self._ids) - 1) // self.page_size, None)
+        first = self.index(view_row, 0)
+        self.dataChanged.emit(first, first.siblingAtColumn(3))
+        return True
+
+    def insertRows(self, row, count, parent=qtc.QModelIndex()):
+        # New rows always go at the end, like the ids they will get
+        first = self.rowCount()
+        self.beginInsertRows(parent, first, first + count - 1)
+        self._new_rows.extend([None, '', '', None] for i in range(count))
+        self.endInsertRows()
+        return True
+
+    def removeRows(self, row, count, parent=qtc.QModelIndex()):
+        self.beginRemoveRows(parent, row, row + count - 1)
+        for i in reversed(range(row, row + count)):
+            if i >= len(self._ids):
+                del self._new_rows[i - len(self._ids)]
+                continue
+            query = qts.QSqlQuery(self.db)
+            query.prepare('DELETE FROM coffees WHERE id = :id')
+            query.bindValue(':id', self._ids[i])
+            query.exec()
+            del self._ids[i]
+        self._pages.clear()
+        self.endRemoveRows()
+        return True
+
+    def remove_row_set(self, rows):
+        """Delete the coffees at rows, and their reviews, in one go
+
+        Returns the ids of the deleted coffees.
+        """
+        rows = set(rows)
+        first_new = len(self._ids)
+        ids = {self._ids[row] for row in rows if row < first_new}
+        for coffee_id in ids:
+            self._edits.pop(coffee_id, None)
+        if ids:
+            self.db.transaction()
+            if not (delete_in(self.db, 'reviews', 'coffee_id', ids)
+                    and delete_in(self.db, 'coffees', 'id', ids)):
+                self.db.rollback()
+                return set()
+            self.db.commit()
+        self.beginResetModel()
+        self._ids = array('q', (id for id in self._ids if id not in ids))
+        self._new_rows = [
+            row for i, row in enumerate(self._new_rows, first_new)
+            if i not in rows
+        ]
+        self._pages.clear()
+        self.endResetModel()
+        return ids
+
+
+class ReviewsModel(qtc.QAbstractTableModel):
+    """The reviews of one coffee, newest first
+
+    The select statement is prepared once and only rebound with the
+    coffee id on load(), so switching coffees costs one index range scan
+    on reviews(coffee_id, review_date) instead of a fresh prepare.
+    The columns match the reviews table.
+
+    The rows of the last max_cached coffees are kept, so going back to
+    a coffee does not touch the reviews table at all.  Our own writes
+    drop or patch the entry of the coffee they touch; writes by other
+    connections show up as a new PRAGMA data_version, which drops the
+    whole cache since it does not say which coffees changed.
+
+    Given a DbWorker, reviews that are not cached are read on the
+    worker's thread; the model shows no rows until they arrive.
+    """
+
+    fields = ['id', 'coffee_id', 'reviewer', 'review_date', 'review']
+    max_cached = 64
+    select_sql = (
+        'SELECT id, coffee_id, reviewer, review_date, review '
+        'FROM reviews WHERE coffee_id = :coffee_id '
+        'ORDER BY review_date DESC')
+
+    def __init__(self, db=None, worker=None):
+        super().__init__()
+        self.db = db or qts.QSqlDatabase.database()
+        self.worker = worker
+        self._select_query = qts.QSqlQuery(self.db)
+        self._select_query.setForwardOnly(True)
+        self._select_query.prepare(self.select_sql)
+        self._version_query = qts.QSqlQuery(self.db)
+        self._version_query.setForwardOnly(True)
+        self._version_query.prepare('PRAGMA data_version')
+        self._data_version = None
+        self._update_queries = {}
+        self._cache = OrderedDict()
+        self._rows = []
+        self.coffee_id = None
+
+    def _fetch(self, coffee_id):
+        query = self._select_query
+        query.bindValue(':coffee_id', coffee_id)
+        rows = []
+        if query.exec():
+            while query.next():
+                rows.append([query.value(i) for i in range(5)])
+        else:
+            print(f'Select failed: {query.lastError().text()}')
+        query.finish()
+        return rows
+
+    def _check_data_version(self):
+        # data_version only changes for commits made by other connections
+        query = self._version_query
+        if query.exec() and query.next():
+            version = query.value(0)
+            if version != self._data_version:
+                self._cache.clear()
+                self._data_version = version
+        query.finish()
+
+    def invalidate(self, coffee_id=None):
+        """Forget the cached reviews of coffee_id, or of every coffee"""
+        if coffee_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(coffee_id, None)
+
+    def _cache_rows(self, coffee_id, rows):
+        self._cache[coffee_id] = rows
+        if len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def _fetched(self, coffee_id, rows):
+        # Rows from the worker, shown if that coffee is still current
+        self._cache_rows(coffee_id, rows)
+        if coffee_id == self.coffee_id:
+            self._show(coffee_id, rows)
+
+    def load(self, coffee_id):
+        """Show the reviews of coffee_id"""
+        self._check_data_version()
+        rows = self._cache.get(coffee_id)
+        if rows is not None:
+            self._cache.move_to_end(coffee_id)
+        elif self.worker is not None:
+            rows = []
+            self.worker.submit(
+                self.select_sql, {':coffee_id': coffee_id},
+                lambda fetched: self._fetched(coffee_id, fetched))
+        else:
+            rows = self._fetch(coffee_id)
+            self._cache_rows(coffee_id, rows)
+        self._show(coffee_id, rows)
+
+    def _show(self, coffee_id, rows):
+        self.beginResetModel()
+        self.coffee_id = coffee_id
+        self._rows = rows
+        self.endResetModel()
+
+    def select(self):
+        if self.coffee_id is not None:
+            self.invalidate(self.coffee_id)
+            self.load(self.coffee_id)
+        return True
+
+    def lastError(self):
+        return self._select_query.lastError()
+
+    def fieldIndex(self, name):
+        return self.fields.index(name) if name in self.fields else -1
+
+    def rowCount(self, parent=qtc.QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=qtc.QModelIndex()):
+        return 0 if parent.isValid() else len(self.fields)
+
+    def data(self, index, role=qtc.Qt.DisplayRole):
+        if index.isValid() and role in (qtc.Qt.DisplayRole, qtc.Qt.EditRole):
+            return self._rows[index.row()][index.column()]
+
+    def headerData(self, section, orientation, role=qtc.Qt.DisplayRole):
+        if orientation == qtc.Qt.Horizontal and role == qtc.Qt.DisplayRole:
+            return self.fields[section]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.column() > self.fieldIndex('coffee_id'):
+            flags |= qtc.Qt.ItemIsEditable
+        return flags
+
+    def _update_query(self, column):
+        # One prepared update per column, kept for the model's lifetime
+        query = self._update_queries.get(column)
+        if query is None:
+            query = qts.QSqlQuery(self.db)
+            query.prepare(
+                f'UPDATE reviews SET {column} = :value WHERE id = :id')
+            self._update_queries[column] = query
+        return query
+
+    def setData(self, index, value, role=qtc.Qt.EditRole):
+        if not index.isValid() or role != qtc.Qt.EditRole:
+            return False
+        if isinstance(value, qtc.QDate):
+            value = value.toString(qtc.Qt.ISODate)
+        row = self._rows[index.row()]
+        query = self._update_query(self.fields[index.column()])
+        query.bindValue(':value', value)
+        query.bindValue(':id', row[0])
+        if not query.exec():
+            print(f'Update failed: {query.lastError().text()}')
+            return False
+        query.finish()
+        # The cached rows are the ones shown, so they are patched too;
+        # a new date may change the order, so that entry is re-read later
+        row[index.column()] = value
+        if index.column() == self.fieldIndex('review_date'):
+            self.invalidate(self.coffee_id)
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def add_review(self, reviewer='', review_date=None, review=''):
+        """Insert a review of the current coffee and show it"""
+        review_date = review_date or qtc.QDate.currentDate()
+        query = qts.QSqlQuery(self.db)
+        query.prepare(
+            'INSERT INTO reviews(coffee_id, reviewer, review_date, review) '
+            'VALUES (:coffee_id, :reviewer, :review_date, :review)')
+        query.bindValue(':coffee_id', self.coffee_id)
+        query.bindValue(':reviewer', reviewer)
+        query.bindValue(':review_date', review_date.toString(qtc.Qt.ISODate))
+        query.bindValue(':review', review)
+        if not query.exec():
+            print(f'Insert failed: {query.lastError().text()}')
+            return False
+        self.select()
+        return True
+
+    def remove_row_set(self, rows):
+        """Delete the reviews at rows with a single statement"""
+        ids = {self._rows[row][0] for row in rows}
+        if not ids:
+            return
+        self.db.transaction()
+        if not delete_in(self.db, 'reviews', 'id', ids):
+            self.db.rollback()
+            return
+        self.db.commit()
+        self.beginResetModel()
+        # Filtered in place: the list is also the cache entry
+        self._rows[:] = [row for row in self._rows if row[0] not in ids]
+        self.endResetModel()
+
+    def removeRows(self, row, count, parent=qtc.QModelIndex()):
+        query = qts.QSqlQuery(self.db)
+        query.prepare('DELETE FROM reviews WHERE id = :id')
+        self.beginRemoveRows(parent, row, row + count - 1)
+        for i in reversed(range(row, row + count)):
+            query.bindValue(':id', self._rows[i][0])
+            query.exec()
+            del self._rows[i]
+        self.endRemoveRows()
+        return True
+
+
+def fill_roast_combo(combo, roasts):
+    """Fill combo with the roast descriptions, with their colors"""
+    combo.clear()
+    for description, color in zip(
+            roasts.values('description'), roasts.values('color')):
+        combo.addItem(description)
+        combo.setItemData(
+            combo.count() - 1, qtg.QColor(color), qtc.Qt.DecorationRole)
+
+
+class RoastDelegate(qtw.QStyledItemDelegate):
+    """Edits the roast column with a combo box of roast descriptions"""
+
+    def createEditor(self, parent, option, index):
+        roasts = index.model().roasts
+        roasts.refresh()
+        combo = qtw.QComboBox(parent)
+        fill_roast_combo(combo, roasts)
+        return combo
+
+
+class SearchResults(qtw.QTableWidget):
+    """Coffees whose names or reviews match a full-text search
+
+    Both FTS5 tables are searched for the best max_hits matches each,
+    then the two lists are merged by their bm25 rank (lower is better).
+    Scoring every match of a common word across millions of reviews
+    takes seconds, so only the newest max_candidates matching reviews
+    are ranked: the rowid bound is found with a cheap walk of the
+    posting list and FTS5 applies it before scoring.
+    Double-clicking a hit emits coffee_activated with the coffee id.
+    """
+
+    coffee_activated = qtc.pyqtSignal(int)
+    max_hits = 100
+    max_candidates = 5000
+    search_sql = (
+        "SELECT hits.coffee_id, "
+        "coffees.coffee_brand || ' ' || coffees.coffee_name, hits.snippet "
+        "FROM ("
+        "SELECT * FROM ("
+        "SELECT rowid AS coffee_id, "
+        "snippet(coffees_fts, -1, '[', ']', '...', 8) AS snippet, rank "
+        "FROM coffees_fts WHERE coffees_fts MATCH :match "
+        "ORDER BY rank LIMIT :limit) "
+        "UNION ALL "
+        "SELECT * FROM ("
+        "SELECT reviews.coffee_id, "
+        "snippet(reviews_fts, 0, '[', ']', '...', 8), reviews_fts.rank "
+        "FROM reviews_fts JOIN reviews ON reviews.id = reviews_fts.rowid "
+        "WHERE reviews_fts MATCH :match AND reviews_fts.rowid >= coalesce(("
+        "SELECT rowid FROM reviews_fts WHERE reviews_fts MATCH :match "
+        "ORDER BY rowid DESC LIMIT 1 OFFSET :candidates), 0) "
+        "ORDER BY reviews_fts.rank LIMIT :limit)"
+        ") AS hits JOIN coffees ON coffees.id = hits.coffee_id "
+        "ORDER BY hits.rank LIMIT :limit")
+
+    def __init__(self, worker):
+        super().__init__(columnCount=2)
+        self.worker = worker
+        self.setHorizontalHeaderLabels(['Coffee', 'Match'])
+        self.horizontalHeader().setSectionResizeMode(
+            1, qtw.QHeaderView.Stretch)
+        self.setEditTriggers(qtw.QAbstractItemView.NoEditTriggers)
+        self.setSelectionBehavior(qtw.QAbstractItemView.SelectRows)
+        self.cellDoubleClicked.connect(
+            lambda row, column: self.coffee_activated.emit(
+                self.item(row, 0).data(qtc.Qt.UserRole)))
+
+    @staticmethod
+    def match_expression(text):
+        # Every word is quoted, so user input is never FTS5 syntax,
+        # except that a trailing * still asks for a prefix match
+        terms = []
+        for word in text.split():
+            prefix = word.endswith('*') and len(word) > 1
+            word = word.rstrip('*') if prefix else word
+            terms.append('"{}"'.format(word.replace('"', '""')))
+            if prefix:
+                terms[-1] += '*'
+        return ' '.join(terms)
+
+    def search(self, text):
+        match = self.match_expression(text)
+        if not match:
+            self.setRowCount(0)
+            return
+        # The worker answers in order, so the last search shows last
+        self.worker.submit(
+            self.search_sql,
+            {':match': match, ':limit': self.max_hits,
+             ':candidates': self.max_candidates},
+            self._show_hits)
+
+    def _show_hits(self, hits):
+        self.setRowCount(len(hits))
+        for row, (coffee_id, coffee, snippet) in enumerate(hits):
+            item = qtw.QTableWidgetItem(coffee)
+            item.setData(qtc.Qt.UserRole, coffee_id)
+            self.setItem(row, 0, item)
+            self.setItem(row, 1, qtw.QTableWidgetItem(snippet))
+        self.resizeColumnToContents(0)
+
+
+def resize_columns_from_sample(view, sample_rows=50):
+    """Size columns to fit the header and the first sample_rows rows
+
+    Unlike resizeColumnsToContents(), the cost does not grow with the
+    number of rows in the model.
+    """
+    model = view.model()
+    metrics = view.fontMetrics()
+    padding = 2 * view.style().pixelMetric(qtw.QStyle.PM_HeaderMargin) + 8
+    rows = min(sample_rows, model.rowCount())
+    for column in range(model.columnCount()):
+        texts = [str(model.headerData(column, qtc.Qt.Horizontal))]
+        texts += [
+            str(model.index(row, column).data() or '')
+            for row in range(rows)
+        ]
+        width = max(metrics.horizontalAdvance(text) for text in texts)
+        view.setColumnWidth(column, width + padding)
+
+
 class CoffeeForm(qtw.QWidget):
     """Form to display/edit all info about a coffee"""
 
@@ -41,8 +834,7 @@ class CoffeeForm(qtw.QWidget):
         self.coffees_model = coffees_model
         self.mapper = qtw.QDataWidgetMapper(self)
         self.mapper.setModel(self.coffees_model)
-        self.mapper.setItemDelegate(
-            qts.QSqlRelationalDelegate(self))
+        self.mapper.setItemDelegate(qtw.QStyledItemDelegate(self))
         self.mapper.addMapping(
             self.coffee_brand,
             self.coffees_model.fieldIndex('coffee_brand')
@@ -55,11 +847,10 @@ class CoffeeForm(qtw.QWidget):
             self.roast,
             self.coffees_model.fieldIndex('description')
         )
-        # retrieve a model for the roasts and setup the combo box
-        roasts_model = coffees_model.relationModel(
-            self.coffees_model.fieldIndex('description'))
-        self.roast.setModel(roasts_model)
-        self.roast.setModelColumn(1)
+        # setup the combo box from the cached roasts table
+        roasts = coffees_model.roasts
+        fill_roast_combo(self.roast, roasts)
+        roasts.changed.connect(lambda: fill_roast_combo(self.roast, roasts))
         # Cause data to be written when changed
 
         # Reviews
@@ -70,6 +861,10 @@ class CoffeeForm(qtw.QWidget):
         self.reviews.hideColumn(1)
         self.reviews.horizontalHeader().setSectionResizeMode(
             4, qtw.QHeaderView.Stretch)
+        # Reviews may arrive after show_coffee() returns
+        reviews_model.modelReset.connect(self.reviews.resizeRowsToContents)
+        reviews_model.modelReset.connect(
+            self.reviews.resizeColumnsToContents)
 
 
         # Using a custom delegate
@@ -86,39 +881,19 @@ class CoffeeForm(qtw.QWidget):
         self.layout().addRow(self.new_review, self.delete_review)
 
     def show_coffee(self, coffee_index):
+        self.coffees_model.roasts.refresh()
         self.mapper.setCurrentIndex(coffee_index.row())
         # show the reviews
         id_index = coffee_index.siblingAtColumn(0)
         self.coffee_id = int(self.coffees_model.data(id_index))
-        self.reviews.model().setFilter(f'coffee_id = {self.coffee_id}')
-        self.reviews.model().setSort(3, qtc.Qt.DescendingOrder)
-        self.reviews.model().select()
-        self.reviews.resizeRowsToContents()
-        self.reviews.resizeColumnsToContents()
+        self.reviews.model().load(self.coffee_id)
 
     def delete_review(self):
-        for index in self.reviews.selectedIndexes() or []:
-            self.reviews.model().removeRow(index.row())
-        self.reviews.model().select()
+        self.reviews.model().remove_row_set(
+            index.row() for index in self.reviews.selectedIndexes())
 
     def add_review(self):
-        reviews_model = self.reviews.model()
-        new_row = reviews_model.record()
-        defaults = {
-            'coffee_id': self.coffee_id,
-            'review_date': qtc.QDate.currentDate(),
-            'reviewer': '',
-            'review': ''
-        }
-        for field, value in defaults.items():
-            index = reviews_model.fieldIndex(field)
-            new_row.setValue(index, value)
-        inserted = reviews_model.insertRecord(-1, new_row)
-        if not inserted:
-            error = reviews_model.lastError().text()
-            print(f"Insert Failed: {error}")
-        # Select so the new row is editable
-        reviews_model.select()
+        self.reviews.model().add_review()
 
 
 class MainWindow(qtw.QMainWindow):
@@ -134,37 +909,53 @@ class MainWindow(qtw.QMainWindow):
         self.stack = qtw.QStackedWidget()
         self.setCentralWidget(self.stack)
         # Connect to the database
-        db = qts.QSqlDatabase.addDatabase('QSQLITE')
-        db.setDatabaseName('coffee.db')
-        if not db.open():
+        self.pool = ConnectionPool('coffee.db')
+        # Opt-in SQL profiling, see sql_profiler.py
+        self.profiler = sql_profiler.from_environment(self.pool)
+        if self.profiler:
+            self.addDockWidget(
+                qtc.Qt.BottomDockWidgetArea,
+                sql_profiler.SqlProfilerPanel(self.profiler, parent=self))
+        db = self.pool.connection()
+        self.db = db
+        if not db.isOpen():
             qtw.QMessageBox.critical(
                 None, 'DB Connection Error',
                 'Could not open database file: '
                 f'{db.lastError().text()}')
             sys.exit(1)
 
-        # Check for missing tables
-        required_tables = {'roasts', 'coffees', 'reviews'}
-        missing_tables = required_tables - set(db.tables())
-        if missing_tables:
+        # Bring the schema up to date, then check it
+        # A failed migration leaves objects missing, so its error goes
+        # first: it says why
+        error = migrations.migrate(db)
+        if error:
+            qtw.QMessageBox.critical(None, 'DB Migration Error', error)
+            sys.exit(1)
+        missing = migrations.check_schema(db)
+        if missing:
             qtw.QMessageBox.critical(
                 None, 'DB Integrity Error',
-                'Missing tables, please repair DB: '
-                f'{missing_tables}')
+                'Missing tables or indexes, please repair DB: '
+                f'{missing}')
             sys.exit(1)
 
+        # Selects run on a worker thread with its own connection
+        self.worker = DbWorker(self.pool, parent=self)
+        self.busy = qtw.QProgressBar(maximum=0, maximumWidth=100)
+        self.busy.hide()
+        self.statusBar().addPermanentWidget(self.busy)
+        self.worker.busy.connect(self.busy.setVisible)
+
         # Create the models
-        self.reviews_model = qts.QSqlTableModel()
-        self.reviews_model.setTable('reviews')
-
-        self.coffees_model = qts.QSqlRelationalTableModel()
-        self.coffees_model.setTable('coffees')
-        self.coffees_model.setRelation(
-            self.coffees_model.fieldIndex('roast_id'),
-            qts.QSqlRelation('roasts', 'id', 'description')
-        )
-        self.coffees_model.setEditStrategy(0)
-        self.coffees_model.dataChanged.connect(print)
+        self.reviews_model = ReviewsModel(db, self.worker)
+
+        self.coffees_model = CoffeeListModel(db, self.worker)
+        self.coffees_model.modelReset.connect(
+            lambda: resize_columns_from_sample(self.coffee_list))
+        self.coffees_model.write_failed.connect(
+            lambda coffee_id, reason: self.statusBar().showMessage(
+                f'Edits to coffee {coffee_id} were not saved: {reason}'))
         self.coffee_list = qtw.QTableView()
         self.coffee_list.setModel(self.coffees_model)
         self.stack.addWidget(self.coffee_list)
@@ -178,8 +969,12 @@ class MainWindow(qtw.QMainWindow):
         toolbar = self.addToolBar('Controls')
         toolbar.addAction('Delete Coffee(s)', self.delete_coffee)
         toolbar.addAction('Add Coffee', self.add_coffee)
+        self.import_action = toolbar.addAction(
+            'Import Reviews', self.import_reviews)
+        self.importer = None
 
-        self.coffee_list.setItemDelegate(qts.QSqlRelationalDelegate())
+        self.coffee_list.setItemDelegateForColumn(
+            self.coffees_model.fieldIndex('description'), RoastDelegate(self))
 
         #self.show()
         #return
@@ -197,25 +992,90 @@ class MainWindow(qtw.QMainWindow):
 
         toolbar.addAction("Back to list", self.show_list)
 
+        # Full-text search
+        self.search_results = SearchResults(self.worker)
+        self.stack.addWidget(self.search_results)
+        self.search_results.coffee_activated.connect(self.open_coffee)
+        self.search_text = qtw.QLineEdit(
+            placeholderText='Search coffees and reviews',
+            clearButtonEnabled=True, maximumWidth=300)
+        self.search_text.returnPressed.connect(self.search)
+        toolbar.addWidget(self.search_text)
+
         # Code ends here
         self.show()
 
     def delete_coffee(self):
-        selected = self.coffee_list.selectedIndexes()
-        for index in selected or []:
-            self.coffees_model.removeRow(index.row())
-        self.coffees_model.select()
+        deleted = self.coffees_model.remove_row_set(
+            index.row() for index in self.coffee_list.selectedIndexes())
+        for coffee_id in deleted:
+            self.reviews_model.invalidate(coffee_id)
 
     def add_coffee(self):
         self.stack.setCurrentWidget(self.coffee_list)
         self.coffees_model.insertRows(
             self.coffees_model.rowCount(), 1)
 
+    def import_reviews(self):
+        filename, _ = qtw.QFileDialog.getOpenFileName(
+            self, 'Import reviews', '', 'CSV files (*.csv)')
+        if not filename:
+            return
+        self.import_action.setEnabled(False)
+        self.import_started = time.perf_counter()
+        self.importer = ReviewImporter(self.pool, filename, self)
+        self.importer.progress.connect(
+            lambda count: self.statusBar().showMessage(
+                f'Importing reviews: {count:,} so far'))
+        self.importer.finished.connect(self.on_import_finished)
+        self.importer.start()
+
+    def on_import_finished(self):
+        importer, self.importer = self.importer, None
+        self.import_action.setEnabled(True)
+        elapsed = time.perf_counter() - self.import_started
+        count = importer.inserted
+        self.reviews_model.invalidate()
+        self.reviews_model.select()
+        message = (
+            f'Imported {count} reviews in {elapsed:.1f}s '
+            f'({count / max(elapsed, 1e-9):,.0f} rows/s)')
+        self.statusBar().showMessage(message)
+        problems = [importer.error] if importer.error else []
+        if importer.bad_rows:
+            problems.append(f'{len(importer.bad_rows)} rows were skipped:')
+            problems.extend(
+                f'line {line}: {problem}'
+                for line, problem in importer.bad_rows[:20])
+            if len(importer.bad_rows) > 20:
+                problems.append('...')
+        if problems:
+            qtw.QMessageBox.warning(
+                self, 'Import Reviews', '\n'.join([message] + problems))
+
+    def search(self):
+        self.search_results.search(self.search_text.text())
+        self.stack.setCurrentWidget(self.search_results)
+
+    def open_coffee(self, coffee_id):
+        index = self.coffees_model.index_of(coffee_id)
+        if index.isValid():
+            self.coffee_form.show_coffee(index)
+            self.stack.setCurrentWidget(self.coffee_form)
+
     def show_list(self):
-        self.coffee_list.resizeColumnsToContents()
-        self.coffee_list.resizeRowsToContents()
+        resize_columns_from_sample(self.coffee_list)
         self.stack.setCurrentWidget(self.coffee_list)
 
+    def closeEvent(self, event):
+        if self.importer is not None:
+            self.importer.finished.disconnect()
+            self.importer.requestInterruption()
+            self.importer.wait()
+        self.coffees_model.flush()
+        self.worker.stop()
+        super().closeEvent(event)
+
 
 if __name__ == '__main__':
     app = qtw.QApplication(sys.argv)
@@ -0,0 +1,67 @@
+"""Per-thread SQLite connections for the coffee apps"""
+import threading
+from PyQt5 import QtSql as qts
+
+
+class ConnectionPool:
+    """Hands out one named QSqlDatabase connection per thread
+
+    A QSqlDatabase may only be used by the thread that opened it, so
+    every thread asks the pool for its own.  Connections are opened in
+    WAL mode, where readers on other connections run alongside a
+    writer instead of waiting on its lock.
+    """
+
+    pragmas = {
+        'journal_mode': 'WAL',
+        # In WAL mode NORMAL only syncs at checkpoints, and stays safe
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,  # KiB, so about 16 MB of pages
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    }
+    busy_timeout = 5000
+
+    def __init__(self, database_name, name='coffee', pragmas=None):
+        self.database_name = database_name
+        self.name = name
+        self.pragmas = dict(self.pragmas, **(pragmas or {}))
+        self._lock = threading.Lock()
+        self._names = set()
+
+    def _connection_name(self):
+        return f'{self.name}-{threading.get_ident()}'
+
+    def connection(self):
+        """The calling thread's connection, opened on first use"""
+        connection_name = self._connection_name()
+        with self._lock:
+            if connection_name in self._names:
+                return qts.QSqlDatabase.database(connection_name)
+            self._names.add(connection_name)
+        db = qts.QSqlDatabase.addDatabase('QSQLITE', connection_name)
+        db.setDatabaseName(self.database_name)
+        db.setConnectOptions(f'QSQLITE_BUSY_TIMEOUT={self.busy_timeout}')
+        if db.open():
+            query = qts.QSqlQuery(db)
+            for pragma, value in self.pragmas.items():
+                if not query.exec(f'PRAGMA {pragma} = {value}'):
+                    print(f'PRAGMA {pragma} failed: '
+                          f'{query.lastError().text()}')
+            query.finish()
+        return db
+
+    def release(self):
+        """Close the calling thread's connection
+
+        Every query on it must have been deleted first.
+        """
+        connection_name = self._connection_name()
+        with self._lock:
+            if connection_name not in self._names:
+                return
+            self._names.discard(connection_name)
+        db = qts.QSqlDatabase.database(connection_name, open=False)
+        db.close()
+        del db
+        qts.QSqlDatabase.removeDatabase(connection_name)
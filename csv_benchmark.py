@@ -0,0 +1,249 @@
+"""Benchmarks for the hot paths of csv_editor.CsvTableModel
+
+Runs headless on the offscreen Qt platform.  Synthetic CSV files are
+generated once per size and reused; every (size, backend) case runs in
+its own process so peak RSS is measured per case.
+
+    python csv_benchmark.py --sizes 10000 100000 --output before.json
+    python csv_benchmark.py --compare before.json after.json
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import subprocess
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5 import QtWidgets as qtw
+from PyQt5 import QtCore as qtc
+
+import csv_editor
+
+SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+BACKENDS = ["list", "mmap", "columnar"]
+HEADERS = ["Menu Item", "Price", "Calories", "Fat", "Carbohydrates", "Notes"]
+WORDS = ["burger", "salad", "fries", "shake", "nuggets", "wrap", "taco"]
+
+
+def generate_csv(filename, rows, seed=0):
+    """Write a deterministic synthetic CSV file with rows data rows"""
+    rng = random.Random(seed)
+    with open(filename, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(HEADERS)
+        for i in range(rows):
+            writer.writerow([
+                f"{rng.choice(WORDS)} {i}",
+                repr(round(rng.uniform(0.5, 20), 2)),
+                rng.randint(0, 1500),
+                rng.randint(0, 80),
+                rng.randint(0, 150),
+                # quoted fields with commas and newlines now and then
+                "spicy, with\nextra sauce" if i % 97 == 0 else "",
+            ])
+
+
+def data_file(data_dir, rows):
+    filename = os.path.join(data_dir, f"synthetic_{rows}.csv")
+    if not os.path.exists(filename):
+        print(f"generating {filename}", file=sys.stderr)
+        generate_csv(filename + ".tmp", rows)
+        os.replace(filename + ".tmp", filename)
+    return filename
+
+
+def percentiles(samples_ns):
+    """p50/p90/p99/max of per-call latencies, in microseconds"""
+    samples = sorted(samples_ns)
+
+    def pick(fraction):
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    return {
+        "calls": len(samples),
+        "p50_us": pick(0.50) / 1000,
+        "p90_us": pick(0.90) / 1000,
+        "p99_us": pick(0.99) / 1000,
+        "max_us": samples[-1] / 1000,
+    }
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def run_case(filename, backend, calls, seed=0):
+    """Drive one model through a QTableView and collect timings"""
+    app = qtw.QApplication.instance() or qtw.QApplication([])
+    rng = random.Random(seed)
+    results = {}
+
+    start = time.perf_counter()
+    model = csv_editor.CsvTableModel(filename, backend=backend)
+    results["load_s"] = time.perf_counter() - start
+
+    view = qtw.QTableView()
+    view.setModel(model)
+    view.resize(1024, 768)
+    view.show()
+    results["first_paint_s"] = timed(app.processEvents)
+    view.scrollToBottom()
+    app.processEvents()
+
+    rows = model.rowCount(None)
+    columns = model.columnCount(None)
+    latencies = []
+    for i in range(calls):
+        index = model.index(rng.randrange(rows), rng.randrange(columns))
+        start = time.perf_counter_ns()
+        model.data(index, qtc.Qt.DisplayRole)
+        latencies.append(time.perf_counter_ns() - start)
+    results["data"] = percentiles(latencies)
+
+    results["sort_s"] = timed(model.sort, 2, qtc.Qt.AscendingOrder)
+    results["sort_text_s"] = timed(model.sort, 0, qtc.Qt.AscendingOrder)
+    results["sort_cached_s"] = timed(model.sort, 2, qtc.Qt.AscendingOrder)
+    results["sort_descending_s"] = timed(
+        model.sort, 2, qtc.Qt.DescendingOrder
+    )
+
+    latencies = []
+    for i in range(min(calls, 100)):
+        position = rng.randrange(model.rowCount(None))
+        start = time.perf_counter_ns()
+        model.insertRows(position, 1, None)
+        latencies.append(time.perf_counter_ns() - start)
+    results["insert_rows"] = percentiles(latencies)
+
+    latencies = []
+    for i in range(min(calls, 100)):
+        position = rng.randrange(model.rowCount(None) - 1)
+        start = time.perf_counter_ns()
+        model.removeRows(position, 1, None)
+        latencies.append(time.perf_counter_ns() - start)
+    results["remove_rows"] = percentiles(latencies)
+
+    selection = rng.sample(range(model.rowCount(None)), max(1, rows // 50))
+    results["remove_row_set_s"] = timed(model.remove_row_set, selection)
+
+    for i in range(10):
+        index = model.index(rng.randrange(model.rowCount(None)), 0)
+        model.setData(index, f"edited {i}", qtc.Qt.EditRole)
+
+    def save():
+        model.save_data()
+        model.wait_for_save()
+
+    results["save_s"] = timed(save)
+
+    model.close()
+    results["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return results
+
+
+def run_all(sizes, backends, calls, data_dir):
+    cases = []
+    for rows in sizes:
+        source = data_file(data_dir, rows)
+        for backend in backends:
+            # Saving changes the file, so every case works on a copy
+            filename = os.path.join(data_dir, f"case_{rows}_{backend}.csv")
+            with open(source, "rb") as src, open(filename, "wb") as dst:
+                dst.write(src.read())
+            print(f"running {rows} rows, {backend}", file=sys.stderr)
+            output = subprocess.run(
+                [
+                    sys.executable, os.path.abspath(__file__),
+                    "--case", filename, backend, str(calls),
+                ],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            cases.append({
+                "rows": rows,
+                "backend": backend,
+                "results": json.loads(output),
+            })
+            os.remove(filename)
+    return {
+        "python": platform.python_version(),
+        "qt": qtc.QT_VERSION_STR,
+        "pyqt": qtc.PYQT_VERSION_STR,
+        "machine": platform.machine(),
+        "calls": calls,
+        "cases": cases,
+    }
+
+
+def _flatten(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+
+def compare(old_file, new_file):
+    """Print new/old ratios for every metric both runs have"""
+    with open(old_file) as fh:
+        old = json.load(fh)
+    with open(new_file) as fh:
+        new = json.load(fh)
+    old_cases = {(c["rows"], c["backend"]): c["results"] for c in old["cases"]}
+    for case in new["cases"]:
+        key = (case["rows"], case["backend"])
+        if key not in old_cases:
+            continue
+        print(f"{case['rows']} rows, {case['backend']}")
+        old_metrics = dict(_flatten(old_cases[key]))
+        for metric, value in _flatten(case["results"]):
+            before = old_metrics.get(metric)
+            if before:
+                print(f"  {metric:28} {before:14.4f} {value:14.4f}"
+                      f" {value / before:8.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument(
+        "--backends", nargs="+", choices=BACKENDS, default=BACKENDS
+    )
+    parser.add_argument(
+        "--calls", type=int, default=10_000,
+        help="data() calls sampled per case",
+    )
+    parser.add_argument("--data-dir", default="benchmark_data")
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--case", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        filename, backend, calls = args.case
+        print(json.dumps(run_case(filename, backend, int(calls))))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = json.dumps(
+        run_all(args.sizes, args.backends, args.calls, args.data_dir),
+        indent=2,
+    )
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
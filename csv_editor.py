@@ -1,23 +1,1127 @@
 import sys
+import os
+import re
+import io
 import csv
+import gc
+import mmap
+import math
+import bisect
+import shutil
+import tempfile
+import itertools
+import contextlib
+import threading
+import multiprocessing
+from concurrent import futures
+from array import array
+from collections import Counter, OrderedDict, defaultdict, deque
 from PyQt5 import QtWidgets as qtw
 from PyQt5 import QtGui as qtg
 from PyQt5 import QtCore as qtc
 from PyQt5.QtCore import QModelIndex
 
 
+class CsvChunkReader(qtc.QThread):
+    """Parses a CSV file in chunks on a background thread
+
+    The reader only runs one chunk ahead of what the model has asked
+    for, so memory grows with the fetched rows, not with the file.
+    """
+
+    chunk_ready = qtc.pyqtSignal()
+
+    def __init__(self, filename, chunk_size, parent=None):
+        super().__init__(parent)
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.chunks = deque()
+        self._credits = threading.Semaphore(1)
+        self._draining = False
+        self._stopped = False
+
+    def request_chunk(self):
+        self._credits.release()
+
+    def drain(self):
+        """Parse the rest of the file without waiting for requests"""
+        self._draining = True
+        self._credits.release()
+
+    def stop(self):
+        self._stopped = True
+        self._credits.release()
+
+    def run(self):
+        with open(self.filename, newline="", encoding="utf-8") as fh:
+            csvreader = csv.reader(fh)
+            next(csvreader, None)  # the model already read the headers
+            while not self._stopped:
+                if not self._draining:
+                    self._credits.acquire()
+                chunk = list(itertools.islice(csvreader, self.chunk_size))
+                if not chunk:
+                    break
+                self.chunks.append(chunk)
+                self.chunk_ready.emit()
+
+
+class ListStore:
+    """CSV rows held in memory as lists of strings"""
+
+    def __init__(self, rows=None):
+        self._rows = rows if rows is not None else []
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def row(self, row):
+        return self._rows[row]
+
+    def cell(self, row, column):
+        return self._rows[row][column]
+
+    def set_cell(self, row, column, value):
+        self._rows[row][column] = value
+
+    def extend(self, rows):
+        self._rows.extend(rows)
+
+    def insert(self, position, rows):
+        self._rows[position:position] = rows
+
+    def remove(self, position, count):
+        del self._rows[position:position + count]
+
+    def compact(self, keep):
+        """Drop every row whose entry in the keep mask is 0"""
+        self._rows = list(itertools.compress(self._rows, keep))
+
+    def column(self, column):
+        return [r[column] for r in self._rows]
+
+    def close(self):
+        pass
+
+
+class ShardedStore:
+    """Several ListStores presented as one, without copying their rows
+
+    self._starts holds the first row number of each shard; a row is
+    found by bisecting it.
+    """
+
+    def __init__(self, filenames, shards):
+        self.filenames = filenames
+        self.shards = [ListStore(rows) for rows in shards]
+        self._update_starts()
+
+    def _update_starts(self):
+        self._starts = list(
+            itertools.accumulate((len(s) for s in self.shards), initial=0)
+        )
+        self._length = self._starts.pop()
+
+    def _locate(self, row):
+        """The shard holding row, and the row's number within it"""
+        shard = bisect.bisect_right(self._starts, row) - 1
+        return self.shards[shard], row - self._starts[shard]
+
+    def shard_of(self, row):
+        return bisect.bisect_right(self._starts, row) - 1
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.shards)
+
+    def row(self, row):
+        shard, row = self._locate(row)
+        return shard.row(row)
+
+    def cell(self, row, column):
+        shard, row = self._locate(row)
+        return shard.cell(row, column)
+
+    def set_cell(self, row, column, value):
+        shard, row = self._locate(row)
+        shard.set_cell(row, column, value)
+
+    def extend(self, rows):
+        self.shards[-1].extend(rows)
+        self._update_starts()
+
+    def insert(self, position, rows):
+        if position >= self._length:
+            self.extend(rows)
+            return
+        shard, position = self._locate(position)
+        shard.insert(position, rows)
+        self._update_starts()
+
+    def remove(self, position, count):
+        while count > 0:
+            shard, local = self._locate(position)
+            removed = min(count, len(shard) - local)
+            shard.remove(local, removed)
+            count -= removed
+            self._update_starts()
+
+    def compact(self, keep):
+        for shard, start in zip(self.shards, self._starts):
+            shard.compact(keep[start:start + len(shard)])
+        self._update_starts()
+
+    def column(self, column):
+        return [v for shard in self.shards for v in shard.column(column)]
+
+    def close(self):
+        pass
+
+
+_MISSING = math.nan
+_MAX_EXACT_INT = 2 ** 53
+
+
+def _parse_cell(kind, text):
+    """Convert text to a float for a numeric column, or raise ValueError
+
+    Only values that format back to exactly the same text are accepted,
+    so saving a columnar file never changes it.
+    """
+    if text == "":
+        return _MISSING
+    if kind == "int":
+        value = int(text)
+        if str(value) != text or abs(value) > _MAX_EXACT_INT:
+            raise ValueError(text)
+        return float(value)
+    value = float(text)
+    if value != value or repr(value) != text:
+        raise ValueError(text)
+    return value
+
+
+def _format_cell(kind, value):
+    if kind == "str":
+        return value
+    if value != value:
+        return ""
+    return str(int(value)) if kind == "int" else repr(value)
+
+
+def _infer_kind(values):
+    for kind in ("int", "float"):
+        try:
+            parsed = [_parse_cell(kind, v) for v in values]
+        except ValueError:
+            continue
+        if any(v == v for v in parsed):
+            return kind
+    return "str"
+
+
+class ColumnarStore:
+    """CSV rows held as one typed buffer per column
+
+    Numeric columns are stored as arrays of doubles (NaN for empty
+    cells) and only formatted back to text when asked for.  A column
+    falls back to a list of strings as soon as it gets a value that
+    could not be saved back unchanged.
+    """
+
+    def __init__(self, column_count, rows=()):
+        # A column's kind is inferred from the first rows it gets;
+        # until then it is an empty list
+        self.kinds = [None] * column_count
+        self.columns = [[] for i in range(column_count)]
+        self._length = 0
+        self.extend(rows)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return (self.row(i) for i in range(self._length))
+
+    def _demote(self, column):
+        kind = self.kinds[column]
+        self.columns[column] = [
+            _format_cell(kind, v) for v in self.columns[column]
+        ]
+        self.kinds[column] = "str"
+
+    def _convert(self, column, values):
+        """Values as they are stored in column, demoting it if needed"""
+        kind = self.kinds[column]
+        if kind != "str":
+            try:
+                return array("d", [_parse_cell(kind, v) for v in values])
+            except ValueError:
+                self._demote(column)
+        return list(values)
+
+    def row(self, row):
+        return [
+            _format_cell(kind, col[row])
+            for kind, col in zip(self.kinds, self.columns)
+        ]
+
+    def cell(self, row, column):
+        return _format_cell(self.kinds[column], self.columns[column][row])
+
+    def column(self, column):
+        return self.columns[column]
+
+    def set_cell(self, row, column, value):
+        self.columns[column][row] = self._convert(column, [value])[0]
+
+    def extend(self, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        width = len(self.columns)
+        values = zip(*(r + [""] * (width - len(r)) for r in rows))
+        for column, column_values in enumerate(values):
+            if column >= width:
+                break
+            if self.kinds[column] is None:
+                self.kinds[column] = _infer_kind(column_values)
+                self.columns[column] = (
+                    list() if self.kinds[column] == "str" else array("d")
+                )
+            # Convert first: it may demote the column to a new list
+            converted = self._convert(column, column_values)
+            self.columns[column].extend(converted)
+        self._length += len(rows)
+
+    def insert(self, position, rows):
+        if not self._length:
+            self.extend(rows)
+            return
+        width = len(self.columns)
+        values = list(zip(*(r + [""] * (width - len(r)) for r in rows)))
+        for column in range(width):
+            column_values = self._convert(column, values[column])
+            self.columns[column][position:position] = column_values
+        self._length += len(rows)
+
+    def remove(self, position, count):
+        for column in self.columns:
+            del column[position:position + count]
+        self._length -= count
+
+    def compact(self, keep):
+        removed = list(_cleared_rows(keep))
+        for i, col in enumerate(self.columns):
+            self.columns[i] = (
+                list(itertools.compress(col, keep))
+                if isinstance(col, list) else _without_rows(col, removed)
+            )
+        self._length -= len(removed)
+
+    def close(self):
+        pass
+
+
+def _sort_keys(values):
+    """Sort keys for a column: numbers if every cell is numeric
+
+    Empty cells sort before everything else.
+    """
+    if isinstance(values, array):
+        return array("d", (-math.inf if v != v else v for v in values))
+    try:
+        return array("d", (float(v) if v else -math.inf for v in values))
+    except ValueError:
+        return values
+
+
+def _clear_rows(mask, rows):
+    """Set mask[row] to 0 for every row in rows, looping in C"""
+    deque(map(mask.__setitem__, rows, itertools.repeat(0)), maxlen=0)
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    """Hold off the cyclic garbage collector
+
+    Bulk removals allocate enough to trigger full collections, which
+    walk every stored row and can cost more than the removal itself.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _cleared_rows(keep):
+    """The positions of the 0 entries of a keep mask, in order"""
+    position = keep.find(0)
+    while position != -1:
+        yield position
+        position = keep.find(0, position + 1)
+
+
+def _without_rows(values, rows):
+    """A copy of an array or bytearray without the items at sorted rows
+
+    The stretches between removed rows are copied as whole memory
+    blocks, so the Python-level work grows with len(rows), not with
+    len(values).
+    """
+    view = memoryview(values)
+    starts = itertools.chain([0], (row + 1 for row in rows))
+    ends = itertools.chain(rows, [len(values)])
+    data = b"".join(map(view.__getitem__, map(slice, starts, ends)))
+    view.release()
+    if isinstance(values, bytearray):
+        return bytearray(data)
+    result = array(values.typecode)
+    result.frombytes(data)
+    return result
+
+
+def _line_terminator(filename):
+    """The line ending used by a CSV file, defaulting to csv's own"""
+    with open(filename, "rb") as fh:
+        head = fh.read(65536)
+    end = head.find(b"\n")
+    if end > 0 and head[end - 1:end] != b"\r":
+        return "\n"
+    return "\r\n"
+
+
+def _encode_row(row, lineterminator, encoding="utf-8"):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator=lineterminator).writerow(row)
+    return buf.getvalue().encode(encoding)
+
+
+class CsvSaver(qtc.QThread):
+    """Writes whole CSV files to temporary files and renames them over
+
+    targets is a list of (filename, rows) pairs.  The rename is atomic,
+    so each file on disk is always either the old or the new version.
+    For the mmap backend the new file is indexed here too, so the model
+    can switch over without blocking the UI.
+    """
+
+    def __init__(self, targets, headers, lineterminator, parent=None):
+        super().__init__(parent)
+        self.targets = targets
+        self.headers = headers
+        self.lineterminator = lineterminator
+        self.reopen = False
+        self.store = None
+        self.error = None
+
+    def run(self):
+        for filename, rows in self.targets:
+            directory, name = os.path.split(os.path.abspath(filename))
+            fd, temp_name = tempfile.mkstemp(
+                dir=directory, prefix=f".{name}.", suffix=".tmp"
+            )
+            try:
+                with open(fd, "w", newline="", encoding="utf-8") as fh:
+                    writer = csv.writer(fh, lineterminator=self.lineterminator)
+                    writer.writerow(self.headers)
+                    writer.writerows(rows)
+                shutil.copymode(filename, temp_name)
+                os.replace(temp_name, filename)
+            except OSError as e:
+                self.error = str(e)
+                if os.path.exists(temp_name):
+                    os.remove(temp_name)
+                return
+        if self.reopen:
+            self.store = MmapStore(self.targets[0][0])
+
+
+def _parse_shard(filename):
+    """Headers and rows of one CSV file; runs in a worker process"""
+    with open(filename, newline="", encoding="utf-8") as fh:
+        csvreader = csv.reader(fh)
+        return next(csvreader, []), list(csvreader)
+
+
+def parse_shards(filenames, progress=None):
+    """Parse CSV files with the same headers in a process pool
+
+    Returns the shared headers and a list of row lists, one per file.
+    progress, if given, is called with (done, total) as files finish.
+    """
+    # spawn rather than fork: the GUI process has threads running
+    context = multiprocessing.get_context("spawn")
+    with futures.ProcessPoolExecutor(mp_context=context) as pool:
+        jobs = {pool.submit(_parse_shard, f): i for i, f in enumerate(filenames)}
+        results = [None] * len(filenames)
+        for done, job in enumerate(futures.as_completed(jobs), 1):
+            results[jobs[job]] = job.result()
+            if progress is not None:
+                progress(done, len(filenames))
+    headers = results[0][0] if results else []
+    for filename, (shard_headers, rows) in zip(filenames, results):
+        if shard_headers != headers:
+            raise ValueError(f"{filename} does not have the same headers")
+    return headers, [rows for shard_headers, rows in results]
+
+
+class CsvShardLoader(qtc.QThread):
+    """Runs parse_shards() off the GUI thread"""
+
+    progress = qtc.pyqtSignal(int, int)
+
+    def __init__(self, filenames, parent=None):
+        super().__init__(parent)
+        self.filenames = filenames
+        self.headers = None
+        self.shards = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.headers, self.shards = parse_shards(
+                self.filenames, self.progress.emit
+            )
+        except (OSError, ValueError, csv.Error) as e:
+            self.error = str(e)
+
+
+# One CSV record: any run of unquoted characters and quoted fields
+# (which may contain newlines), up to the terminating newline.
+_RECORD = re.compile(rb'(?:[^"\n]|"[^"]*")*\n?')
+_NEWLINE = re.compile(rb"\n")
+
+
+class MmapStore:
+    """CSV rows decoded on demand from a memory-mapped file
+
+    Only an array of record byte offsets is kept in memory.  Entries in
+    the index >= 0 are file offsets; negative entries point into
+    self._extra, which holds rows that were edited or inserted.
+    """
+
+    cache_size = 256
+
+    def __init__(self, filename, encoding="utf-8"):
+        self.filename = filename
+        self.encoding = encoding
+        self._extra = []
+        self._origins = {}
+        self._cache = OrderedDict()
+        self._fh = open(filename, "rb")
+        if os.fstat(self._fh.fileno()).st_size:
+            self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._mm = b""
+        header_end = _RECORD.match(self._mm).end()
+        self.headers = self._decode(0, header_end) if header_end else []
+        self._index = self._build_index(header_end)
+
+    def _build_index(self, start):
+        buf = self._mm
+        index = array("q")
+        if start >= len(buf):
+            return index
+        index.append(start)
+        if buf.find(b'"', start) == -1:
+            # No quoting, so every newline ends a record
+            index.extend(m.end() for m in _NEWLINE.finditer(buf, start))
+        else:
+            index.extend(m.end() for m in _RECORD.finditer(buf, start))
+        # The last offset is the end of the file, not a record
+        while index and index[-1] >= len(buf):
+            index.pop()
+        return index
+
+    def _decode(self, start, end):
+        text = self._mm[start:end].decode(self.encoding)
+        return next(csv.reader([text]), [])
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        # Does not touch the row cache, so a save thread can iterate
+        return (
+            self._extra[-o - 1] if o < 0 else self.row_at(o)
+            for o in self._index
+        )
+
+    def row(self, row):
+        offset = self._index[row]
+        if offset < 0:
+            return self._extra[-offset - 1]
+        cached = self._cache.get(offset)
+        if cached is None:
+            end = _RECORD.match(self._mm, offset).end()
+            cached = self._cache[offset] = self._decode(offset, end)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return cached
+
+    def cell(self, row, column):
+        return self.row(row)[column]
+
+    def _add_extra(self, row):
+        self._extra.append(row)
+        return -len(self._extra)
+
+    def set_cell(self, row, column, value):
+        offset = self._index[row]
+        if offset >= 0:
+            self._index[row] = self._add_extra(list(self.row(row)))
+            self._origins[self._index[row]] = offset
+        self._extra[-self._index[row] - 1][column] = value
+
+    def span(self, row):
+        """Byte range the row was read from, or None for inserted rows"""
+        offset = self._index[row]
+        offset = self._origins.get(offset) if offset < 0 else offset
+        if offset is None:
+            return None
+        return offset, _RECORD.match(self._mm, offset).end()
+
+    def raw(self, start, end):
+        return self._mm[start:end]
+
+    def restore(self, row):
+        """Read an edited row from the file again after it was patched"""
+        offset = self._origins.pop(self._index[row])
+        self._index[row] = offset
+        self._cache.pop(offset, None)
+
+    def extend(self, rows):
+        self._index.extend(self._add_extra(r) for r in rows)
+
+    def insert(self, position, rows):
+        self._index[position:position] = array(
+            "q", (self._add_extra(r) for r in rows)
+        )
+
+    def remove(self, position, count):
+        del self._index[position:position + count]
+
+    def compact(self, keep):
+        self._index = _without_rows(self._index, list(_cleared_rows(keep)))
+
+    def row_at(self, offset):
+        end = _RECORD.match(self._mm, offset).end()
+        return self._decode(offset, end)
+
+    def column(self, column):
+        # Bypass the row cache; every row is only read once here
+        return [
+            (self._extra[-o - 1] if o < 0 else self.row_at(o))[column]
+            for o in self._index
+        ]
+
+    def close(self):
+        self._cache.clear()
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._fh.close()
+
+
+_TOKEN = re.compile(r"\w+")
+
+
+def _row_matches(row, words, columns):
+    """Whether every word is a prefix of a token in one of the columns"""
+    tokens = [
+        token
+        for column in columns
+        for token in _TOKEN.findall(str(row[column]).lower())
+    ]
+    return all(any(t.startswith(w) for t in tokens) for w in words)
+
+
+class CsvSearchIndex:
+    """Inverted index from lower-cased word tokens to stored rows
+
+    There is one index per column, with its tokens kept sorted so a
+    prefix query is a bisect plus a scan over the matching tokens.
+    Rows edited after the build are listed in dirty_rows and checked
+    directly, as are rows added past row_count.
+    """
+
+    def __init__(self, column_count):
+        self.row_count = 0
+        self.dirty_rows = set()
+        self._postings = [defaultdict(lambda: array("q"))
+                          for i in range(column_count)]
+        self._tokens = None
+
+    def add_row(self, row_id, row):
+        for postings, value in zip(self._postings, row):
+            for token in set(_TOKEN.findall(str(value).lower())):
+                postings[token].append(row_id)
+        self.row_count = row_id + 1
+
+    def finish(self):
+        self._postings = [dict(p) for p in self._postings]
+        self._tokens = [sorted(p) for p in self._postings]
+
+    def _prefix_rows(self, column, prefix):
+        tokens = self._tokens[column]
+        postings = self._postings[column]
+        rows = set()
+        for i in range(bisect.bisect_left(tokens, prefix), len(tokens)):
+            if not tokens[i].startswith(prefix):
+                break
+            rows.update(postings[tokens[i]])
+        return rows
+
+    def search(self, text, store, column=None):
+        """Stored rows matching every word of text, as a keep mask"""
+        words = _TOKEN.findall(text.lower())
+        columns = range(len(self._postings)) if column is None else [column]
+        rows = None
+        for word in words:
+            word_rows = set()
+            for c in columns:
+                word_rows |= self._prefix_rows(c, word)
+            rows = word_rows if rows is None else rows & word_rows
+            if not rows:
+                break
+        rows = (rows or set()) - self.dirty_rows
+        unindexed = itertools.chain(
+            self.dirty_rows, range(self.row_count, len(store))
+        )
+        for row in unindexed:
+            if row < len(store) and _row_matches(
+                store.row(row), words, columns
+            ):
+                rows.add(row)
+        keep = bytearray(len(store))
+        for row in rows:
+            keep[row] = 1
+        return keep
+
+
+class CsvIndexBuilder(qtc.QThread):
+    """Builds a CsvSearchIndex over a store on a background thread"""
+
+    def __init__(self, store, column_count, generation, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.generation = generation
+        self.index = CsvSearchIndex(column_count)
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def run(self):
+        for row_id, row in enumerate(self.store):
+            if self._stopped:
+                return
+            self.index.add_row(row_id, row)
+        self.index.finish()
+
+
+def _numeric_values(values):
+    """The non-empty values of a column as floats
+
+    Raises ValueError if the column is not numeric.
+    """
+    if isinstance(values, array):
+        return array("d", itertools.filterfalse(math.isnan, values))
+    return array("d", map(float, filter(None, values)))
+
+
+class ColumnStats:
+    """Sum, min, max, mean and distinct count of a numeric column
+
+    Built in one pass over the column, then kept current one cell at a
+    time with add() and remove().
+    """
+
+    def __init__(self, values):
+        self.counts = Counter(values)
+        self.count = len(values)
+        self.total = math.fsum(values)
+        self.minimum = min(values, default=None)
+        self.maximum = max(values, default=None)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def distinct(self):
+        return len(self.counts)
+
+    def add(self, value):
+        self.counts[value] += 1
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def remove(self, value):
+        self.counts[value] -= 1
+        if not self.counts[value]:
+            del self.counts[value]
+        self.count -= 1
+        self.total -= value
+        # Only look for a new extreme when the last copy of one went
+        if value == self.minimum and value not in self.counts:
+            self.minimum = min(self.counts, default=None)
+        if value == self.maximum and value not in self.counts:
+            self.maximum = max(self.counts, default=None)
+
+
+class CsvStatsSignals(qtc.QObject):
+
+    finished = qtc.pyqtSignal(int, int, object)
+
+
+class CsvStatsTask(qtc.QRunnable):
+    """Computes ColumnStats for one column on a thread pool"""
+
+    def __init__(self, store, column, version, signals):
+        super().__init__()
+        self.store = store
+        self.column = column
+        self.version = version
+        self.signals = signals
+
+    def run(self):
+        try:
+            stats = ColumnStats(_numeric_values(self.store.column(self.column)))
+        except ValueError:
+            stats = None  # not a numeric column
+        self.signals.finished.emit(self.column, self.version, stats)
+
+
+class CsvStatsCollector(qtc.QObject):
+    """Column statistics for a CsvTableModel
+
+    Nothing is computed while the collector is inactive; the window
+    activates it while the statistics panel is visible.  Columns whose
+    first sample_size rows are all numeric are then summarized one at a
+    time in the background, and again after rows are removed or loaded;
+    single cell edits update the summaries in place.  A streaming model
+    is summarized over the rows it has loaded so far.
+    stats[column] is None for columns that are not numeric and missing
+    while a column is still being computed.
+    """
+
+    updated = qtc.pyqtSignal(int)
+
+    sample_size = 1000
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.stats = {}
+        self._versions = [0] * model.columnCount(None)
+        self._active = False
+        self._stale = True
+        self._signals = CsvStatsSignals(self)
+        self._signals.finished.connect(self._on_task_finished)
+        self._pool = qtc.QThreadPool(self)
+        # The tasks hold the GIL and each decodes a whole column, so
+        # running them side by side only adds memory and UI stalls
+        self._pool.setMaxThreadCount(1)
+        self._refresh_timer = qtc.QTimer(self, singleShot=True, interval=200)
+        self._refresh_timer.timeout.connect(self.refresh)
+        model.cell_changed.connect(self._on_cell_changed)
+        model.rows_moved.connect(self._on_rows_changed)
+        model.rowsInserted.connect(self._on_rows_changed)
+
+    def set_active(self, active):
+        self._active = active
+        if active and self._stale:
+            self.refresh()
+
+    def _on_rows_changed(self):
+        self._stale = True
+        if self._active:
+            self._refresh_timer.start()
+
+    def refresh(self):
+        self._stale = False
+        store = self.model._data
+        sample = [store.row(row)
+                  for row in range(min(len(store), self.sample_size))]
+        for column in range(len(self._versions)):
+            try:
+                _numeric_values([row[column] for row in sample])
+            except ValueError:
+                self._versions[column] += 1  # drop a running computation
+                self.stats[column] = None
+                self.updated.emit(column)
+            else:
+                self._start(column)
+
+    def _start(self, column):
+        self._versions[column] += 1
+        self._pool.start(CsvStatsTask(
+            self.model._data, column, self._versions[column], self._signals
+        ))
+
+    def _restart(self, column):
+        """Compute column from scratch, now or once active again"""
+        self.stats.pop(column, None)
+        if self._active:
+            self._start(column)
+        else:
+            self._versions[column] += 1  # drop a running computation
+            self._stale = True
+        self.updated.emit(column)
+
+    def close(self):
+        """Wait for running computations; call before closing the model"""
+        self._refresh_timer.stop()
+        self._pool.clear()
+        self._pool.waitForDone()
+
+    def _on_task_finished(self, column, version, stats):
+        if version != self._versions[column]:
+            return  # the column changed while it was being computed
+        self.stats[column] = stats
+        self.updated.emit(column)
+
+    def _on_cell_changed(self, column, old, new):
+        if column not in self.stats:
+            self._restart(column)  # still computing, so start over
+            return
+        stats = self.stats[column]
+        try:
+            new_value = float(new) if new else None
+        except ValueError:
+            if stats is not None:
+                self._restart(column)  # no longer numeric
+            return
+        if stats is None:
+            # The edit may have replaced the last non-numeric value
+            if new_value is not None:
+                self._restart(column)
+            return
+        if old:
+            stats.remove(float(old))
+        if new_value is not None:
+            stats.add(new_value)
+        self.updated.emit(column)
+
+
 class CsvTableModel(qtc.QAbstractTableModel):
-    """Model for CSV table"""
+    """Model for CSV table
+
+    With streaming=True, rows are parsed in the background and handed to
+    the view through canFetchMore()/fetchMore() as it scrolls.
+    With backend="mmap", the file is memory-mapped and rows are only
+    decoded when the view asks for them.  With backend="columnar", each
+    column is stored in a typed buffer and formatted on demand.
+    With backend="sharded", csv_file is a list of files with the same
+    headers, shown one after another; pass their parsed rows as shards
+    (see parse_shards()) or they are parsed here.
 
-    def __init__(self, csv_file):
+    Saving only writes what changed when it can: rows added at the end
+    are appended, and edits that keep a row's length are patched in
+    place (mmap backend).  Anything else is rewritten on a background
+    thread; the model is read-only until the saved signal is emitted.
+
+    Sorting never reorders the stored rows.  View rows are mapped to
+    stored rows through a permutation (self._order), and the ascending
+    permutation of each sorted column is cached until the data changes.
+    Filtering narrows that permutation to the rows a CsvSearchIndex
+    matched.  While the view is sorted or filtered, new rows are stored
+    at the end of the file.
+    """
+
+    saved = qtc.pyqtSignal(bool, str)
+    # Emitted with the number of matching rows before the view updates
+    filtered = qtc.pyqtSignal(int)
+    indexing = qtc.pyqtSignal()
+    # column, old text, new text
+    cell_changed = qtc.pyqtSignal(int, str, str)
+    # Stored rows were inserted before the end or removed
+    rows_moved = qtc.pyqtSignal()
+
+    max_remove_runs = 64
+
+    def __init__(
+        self, csv_file, streaming=False, chunk_size=1000, backend="list",
+        shards=None,
+    ):
         super().__init__()
         self.filename = csv_file
-        with open(self.filename) as fh:
+        self.backend = backend
+        self._reader = None
+        self._order = None
+        # Whether _order is stored reversed; _sort_order is what the
+        # view asked for, which inserts and removals don't change
+        self._descending = False
+        self._sort_order = qtc.Qt.AscendingOrder
+        self._sort_keys = {}
+        self._sort_orders = {}
+        self._saver = None
+        # Save requested while a streaming model is still loading
+        self._save_pending = False
+        self._dirty_rows = set()
+        self._rewrite_needed = False
+        self._sort_column = None
+        self._filter_mask = None
+        self._filter_text = ""
+        self._filter_column = None
+        self._index = None
+        self._indexer = None
+        # Bumped whenever stored rows move, which makes the index stale
+        self._generation = 0
+        if backend == "sharded":
+            if streaming:
+                raise ValueError("The sharded backend does not stream")
+            if shards is None:
+                self._headers, shards = parse_shards(csv_file)
+            else:
+                self._headers, shards = shards
+            self.filename = csv_file[0]
+            self._data = ShardedStore(csv_file, shards)
+            self._saved_length = len(self._data)
+            return
+        if backend == "mmap":
+            if streaming:
+                raise ValueError("The mmap backend does not stream")
+            self._data = MmapStore(self.filename)
+            self._headers = self._data.headers
+            self._saved_length = len(self._data)
+            return
+        with open(self.filename, newline="", encoding="utf-8") as fh:
             csvreader = csv.reader(fh)
             self._headers = next(csvreader)
-            self._data = list(csvreader)
+            if backend == "columnar":
+                self._data = ColumnarStore(len(self._headers))
+                while not streaming:
+                    chunk = list(itertools.islice(csvreader, chunk_size))
+                    if not chunk:
+                        break
+                    self._data.extend(chunk)
+            else:
+                self._data = ListStore([] if streaming else list(csvreader))
+        # Streamed rows are appended, but they are not new to the file
+        self._saved_length = math.inf if streaming else len(self._data)
+        if streaming:
+            self._fetch_wanted = True
+            self._reader = CsvChunkReader(self.filename, chunk_size, self)
+            self._reader.chunk_ready.connect(self._on_chunk_ready)
+            self._reader.finished.connect(self._on_reader_finished)
+            self._reader.start()
+
+    def _on_chunk_ready(self):
+        if self._save_pending:
+            self._load_for_save()
+        elif self._fetch_wanted:
+            self.fetchMore(qtc.QModelIndex())
+
+    def _on_reader_finished(self):
+        # finished is emitted just before the thread stops running
+        if self._reader is not None:
+            self._reader.wait()
+        self._on_chunk_ready()
+
+    def _load_for_save(self):
+        """Take one parsed chunk; save once the whole file is in"""
+        if self._reader is None:
+            return
+        if self._reader.isRunning():
+            self.fetchMore(qtc.QModelIndex())
+            return
+        # Finished: the few chunks left are the ones parsed ahead
+        self.fetch_all()
+        self._save_pending = False
+        self.save_data()
+
+    def canFetchMore(self, parent):
+        if self._reader is None or parent.isValid():
+            return False
+        # Check the thread first: once it has finished, all chunks are queued
+        running = self._reader.isRunning()
+        return running or bool(self._reader.chunks)
+
+    def fetchMore(self, parent):
+        if self._reader is None or parent.isValid():
+            return
+        if not self._reader.chunks:
+            # Nothing parsed yet; insert it as soon as it arrives
+            self._fetch_wanted = True
+            return
+        self._fetch_wanted = False
+        chunk = self._reader.chunks.popleft()
+        self._reader.request_chunk()
+        position = len(self._data)
+        self.beginInsertRows(
+            qtc.QModelIndex(), position, position + len(chunk) - 1
+        )
+        self._data.extend(chunk)
+        self.endInsertRows()
+
+    def fetch_all(self):
+        """Block until the whole file is loaded into the model"""
+        if self._reader is None:
+            return
+        self._reader.drain()
+        self._reader.wait()
+        rows = []
+        while self._reader.chunks:
+            rows.extend(self._reader.chunks.popleft())
+        if rows:
+            position = len(self._data)
+            self.beginInsertRows(
+                qtc.QModelIndex(), position, position + len(rows) - 1
+            )
+            self._data.extend(rows)
+            self.endInsertRows()
+        self._reader = None
+        self._saved_length = len(self._data)
+
+    def close(self):
+        """Stop any background parsing and release the file"""
+        self.wait_for_save()
+        if self._reader is not None:
+            self._reader.stop()
+            self._reader.wait()
+            self._reader = None
+        self._stop_indexer()
+        self._data.close()
+
+    def _source_row(self, row):
+        """The stored row shown at view row `row`"""
+        if self._order is None:
+            return row
+        if self._descending:
+            row = len(self._order) - 1 - row
+        return self._order[row]
+
+    def _materialize_order(self):
+        """Turn a descending view of the cached order into a plain one"""
+        if self._order is not None and self._descending:
+            self._order = self._order[::-1]
+            self._descending = False
+
+    def _invalidate_sort_cache(self, column=None):
+        if column is None:
+            self._sort_keys.clear()
+            self._sort_orders.clear()
+        else:
+            self._sort_keys.pop(column, None)
+            self._sort_orders.pop(column, None)
 
     def rowCount(self, parent):
+        if self._order is not None:
+            return len(self._order)
         return len(self._data)
 
     def columnCount(self, parent):
@@ -25,7 +1129,8 @@ class CsvTableModel(qtc.QAbstractTableModel):
 
     def data(self, index, role):
         if role in (qtc.Qt.DisplayRole, qtc.Qt.EditRole):
-            return self._data[index.row()][index.column()]
+            row = self._source_row(index.row())
+            return self._data.cell(row, index.column())
 
     def headerData(self, section, orientation, role):
         if orientation == qtc.Qt.Horizontal and role == qtc.Qt.DisplayRole:
@@ -33,50 +1138,422 @@ class CsvTableModel(qtc.QAbstractTableModel):
         else:
             return super().headerData(section, orientation, role)
 
+    def _permutation(self, column):
+        """Stored rows in ascending order of column, cached"""
+        permutation = self._sort_orders.get(column)
+        if permutation is None:
+            keys = self._sort_keys.get(column)
+            if keys is None:
+                keys = self._sort_keys[column] = _sort_keys(
+                    self._data.column(column)
+                )
+            permutation = self._sort_orders[column] = array(
+                "q", sorted(range(len(keys)), key=keys.__getitem__)
+            )
+        return permutation
+
+    def _view_order(self):
+        """The order for the current sort column and filter"""
+        if self._sort_column is None:
+            if self._filter_mask is None:
+                return None
+            base = range(len(self._data))
+        else:
+            base = self._permutation(self._sort_column)
+            if self._filter_mask is None:
+                return base
+        mask = self._filter_mask
+        return array(
+            "q", itertools.compress(base, map(mask.__getitem__, base))
+        )
+
     def sort(self, column, order):
+        self.fetch_all()
+        self._sort_column = column
+        self._sort_order = order
+        order_array = self._view_order()
         self.layoutAboutToBeChanged.emit()  # needs to be emitted before a sort
-        self._data.sort(key=lambda x: x[column])
-        if order == qtc.Qt.DescendingOrder:
-            self._data.reverse()
+        self._set_order(order_array)
         self.layoutChanged.emit()  # needs to be emitted after a sort
 
+    def _set_order(self, order_array):
+        """Show order_array (from _view_order()) in the sort direction"""
+        self._order = order_array
+        self._descending = (
+            self._sort_column is not None
+            and self._sort_order == qtc.Qt.DescendingOrder
+        )
+
+    def set_filter(self, text, column=None):
+        """Show only rows where every word of text starts a word in column
+
+        With column=None, all columns are searched.  The search index is
+        built in the background the first time; the filter is applied
+        as soon as it is ready.  Only a filter with words in it loads a
+        streaming model completely.
+        """
+        self._filter_text = text
+        self._filter_column = column
+        if not _TOKEN.search(text):
+            self._apply_filter(None)
+            return
+        self.fetch_all()
+        if self._index is not None and (
+            self._index_generation == self._generation
+        ):
+            self._apply_filter(
+                self._index.search(text, self._data, column)
+            )
+        else:
+            self._build_index()
+
+    def _apply_filter(self, mask):
+        if mask is None and self._filter_mask is None:
+            return
+        self.filtered.emit(
+            len(self._data) if mask is None else mask.count(1)
+        )
+        self.beginResetModel()
+        self._filter_mask = mask
+        self._set_order(self._view_order())
+        self.endResetModel()
+
+    def _rows_moved(self):
+        """Stored rows were inserted or removed, so the index is stale"""
+        self._generation += 1
+        self._stop_indexer()
+        self.rows_moved.emit()
+
+    def _stop_indexer(self):
+        if self._indexer is not None:
+            self._indexer.stop()
+            self._indexer.wait()
+            self._indexer = None
+
+    def _build_index(self):
+        if self._indexer is not None:
+            return  # already building for the current rows
+        self.indexing.emit()
+        self._indexer = CsvIndexBuilder(
+            self._data, len(self._headers), self._generation, self
+        )
+        self._indexer.finished.connect(self._on_index_built)
+        self._indexer.start()
+
+    def _on_index_built(self):
+        indexer = self.sender()
+        if indexer is not self._indexer:
+            return  # a stopped build
+        self._indexer = None
+        self._index = indexer.index
+        self._index_generation = indexer.generation
+        self.set_filter(self._filter_text, self._filter_column)
+
     def flags(self, index):
+        if self._saving():
+            return super().flags(index)
         return super().flags(index) | qtc.Qt.ItemIsEditable
 
     def setData(self, index, value, role):
+        if self._saving():
+            return False
         if index.isValid() and role == qtc.Qt.EditRole:
-            self._data[index.row()][index.column()] = value
+            row = self._source_row(index.row())
+            old_value = self._data.cell(row, index.column())
+            self._data.set_cell(row, index.column(), value)
+            if row < self._saved_length:
+                self._dirty_rows.add(row)
+            if self._index is not None:
+                self._index.dirty_rows.add(row)
+            if self._indexer is not None:
+                # The builder may already have indexed the old text
+                self._indexer.index.dirty_rows.add(row)
+            self._invalidate_sort_cache(index.column())
             self.dataChanged.emit(index, index, [role])
+            self.cell_changed.emit(
+                index.column(), old_value, self._data.cell(row, index.column())
+            )
             return True
         else:
             return False
 
     def insertRows(self, position, rows, parent):
+        if self._saving():
+            return False
+        if self._order is None and (
+            position < len(self._data) or self._reader is not None
+        ):
+            self._rewrite_needed = True
+            self._rows_moved()
         self.beginInsertRows(
             parent or qtc.QModelIndex(),
             position,
             position + rows - 1,
         )
-        for i in range(rows):
-            default_row = [""] * len(self._headers)
-            self._data.insert(position, default_row)
+        self._invalidate_sort_cache()
+        new_rows = [[""] * len(self._headers) for i in range(rows)]
+        if self._order is None:
+            self._data.insert(position, new_rows)
+        else:
+            # Sorted or filtered: store the rows at the end, show them
+            # at position
+            self._materialize_order()
+            first = len(self._data)
+            self._order[position:position] = array(
+                "q", range(first, first + rows)
+            )
+            self._data.extend(new_rows)
+            if self._filter_mask is not None:
+                self._filter_mask.extend(b"\x01" * rows)
         self.endInsertRows()
+        return True
 
     def removeRows(self, position, rows, parent):
-        self.beginRemoveRows(
-            parent or qtc.QModelIndex(),
-            position,
-            position + rows - 1,
-        )
-        for i in range(rows):
-            del self._data[position]
-        self.endRemoveRows()
+        return self._remove_runs([(position, rows)])
+
+    def remove_row_set(self, rows):
+        """Remove any set of view rows, e.g. a non-contiguous selection
+
+        Each contiguous run gets one beginRemoveRows()/endRemoveRows()
+        pair; past max_remove_runs runs, the model is reset instead.
+        """
+        rows = sorted(set(rows))
+        keep = bytearray(b"\x01") * self.rowCount(None)
+        _clear_rows(keep, rows)
+        # A run starts at the first row or after a kept one
+        run_count = keep.count(b"\x01\x00") + keep.startswith(b"\x00")
+        if run_count > self.max_remove_runs:
+            return self._remove_mask(keep, rows)
+        runs = []
+        position = keep.find(0)
+        while position != -1:
+            end = keep.find(1, position)
+            if end == -1:
+                end = len(keep)
+            runs.append((position, end - position))
+            position = keep.find(0, end)
+        return self._remove_runs(runs)
+
+    def _remove_mask(self, keep, rows):
+        """Remove the view rows cleared in keep, resetting the model
+
+        rows lists the same view rows, sorted.
+        """
+        if self._saving():
+            return False
+        self._invalidate_sort_cache()
+        self._materialize_order()
+        self.beginResetModel()
+        with _gc_paused():
+            if self._order is None:
+                self._drop_source_rows(keep)
+            else:
+                source_keep = self._source_mask(
+                    map(self._order.__getitem__, rows)
+                )
+                self._drop_source_rows(source_keep)
+                self._renumber_order(
+                    _without_rows(self._order, rows), source_keep
+                )
+        self.endResetModel()
+        return True
+
+    def _remove_runs(self, runs):
+        """Remove sorted, non-overlapping (position, count) view runs"""
+        if self._saving():
+            return False
+        self._invalidate_sort_cache()
+        self._materialize_order()
+        removed = []
+        for position, count in reversed(runs):
+            self.beginRemoveRows(
+                qtc.QModelIndex(), position, position + count - 1
+            )
+            if self._order is None:
+                if position < self._saved_length:
+                    self._rewrite_needed = True
+                self._rows_moved()
+                self._data.remove(position, count)
+            else:
+                # Only unlink them here; the store is compacted once below
+                removed.extend(self._order[position:position + count])
+                del self._order[position:position + count]
+            self.endRemoveRows()
+        if removed:
+            with _gc_paused():
+                source_keep = self._source_mask(removed)
+                self._drop_source_rows(source_keep)
+                self._renumber_order(self._order, source_keep)
+        return True
+
+    def _source_mask(self, rows):
+        """A keep mask over stored rows with `rows` cleared"""
+        keep = bytearray(b"\x01") * len(self._data)
+        _clear_rows(keep, rows)
+        return keep
+
+    def _drop_source_rows(self, keep):
+        first_removed = keep.find(0)
+        if first_removed == -1:
+            return
+        if first_removed < self._saved_length:
+            self._rewrite_needed = True
+        self._rows_moved()
+        self._data.compact(keep)
+        if self._filter_mask is not None:
+            self._filter_mask = _without_rows(
+                self._filter_mask, list(_cleared_rows(keep))
+            )
+
+    def _renumber_order(self, order, keep):
+        """Set the order to `order` pointing at stored rows compacted by keep
+
+        Rows before the first removed one keep their numbers, so only
+        the tail of the renumbering table is built.
+        """
+        first_removed = keep.find(0)
+        if first_removed == -1:
+            self._order = array("q", order)
+            return
+        # new position of a kept row = number of kept rows before it
+        new_rows = array("q", range(first_removed))
+        new_rows.extend(itertools.accumulate(
+            itertools.islice(keep, first_removed, None),
+            initial=first_removed - 1,
+        ))
+        del new_rows[first_removed]
+        self._order = array("q", map(new_rows.__getitem__, order))
 
     def save_data(self):
-        with open(self.filename, "w", encodeing="utf-8") as fh:
-            writer = csv.writer(fh)
-            writer.writerow(self._headers)
-            writer.writerows(self._data)
+        """Write changes back to the file
+
+        Returns False if a save is already running.  The saved signal
+        is emitted once the data is on disk.  A streaming model first
+        finishes loading in the background; it is read-only meanwhile.
+        """
+        if self._saving():
+            return False
+        if self._reader is not None:
+            # Parse the rest of the file in the background, one chunk
+            # per event, and save when it is all in (_load_for_save())
+            self._save_pending = True
+            self._reader.drain()
+            return True
+        lineterminator = _line_terminator(self.filename)
+        if self.backend == "sharded":
+            return self._save_shards(lineterminator)
+        if self._rewrite_needed or not self._patch_rows(lineterminator):
+            self._start_rewrite(
+                [(self.filename, self._data)], lineterminator
+            )
+            return True
+        self._append_rows(lineterminator)
+        self._mark_saved()
+        self.saved.emit(True, f"Saved {self.filename}")
+        return True
+
+    def _saving(self):
+        """Whether a save is running or waiting for the file to load"""
+        return self._saver is not None or self._save_pending
+
+    def _patch_rows(self, lineterminator):
+        """Overwrite edited rows in place, if they all keep their size"""
+        if not self._dirty_rows:
+            return True
+        if not hasattr(self._data, "span"):
+            return False
+        patches = []
+        for row in sorted(self._dirty_rows):
+            span = self._data.span(row)
+            if span is None:
+                return False
+            start, end = span
+            old = self._data.raw(start, end)
+            if not old.endswith(b"\n"):
+                lineterminator = ""  # the last line of the file
+            new = _encode_row(self._data.row(row), lineterminator)
+            if len(new) != len(old):
+                return False
+            patches.append((row, start, new))
+        with open(self.filename, "r+b") as fh:
+            for row, start, new in patches:
+                fh.seek(start)
+                fh.write(new)
+        for row, start, new in patches:
+            self._data.restore(row)
+        return True
+
+    def _append_rows(self, lineterminator):
+        if len(self._data) <= self._saved_length:
+            return
+        with open(self.filename, "ab") as fh:
+            fh.seek(0, os.SEEK_END)
+            if fh.tell():
+                with open(self.filename, "rb") as last:
+                    last.seek(-1, os.SEEK_END)
+                    if last.read(1) != b"\n":
+                        fh.write(lineterminator.encode())
+            for row in range(self._saved_length, len(self._data)):
+                fh.write(_encode_row(self._data.row(row), lineterminator))
+
+    def _save_shards(self, lineterminator):
+        """Rewrite the shard files that have changed"""
+        store = self._data
+        if self._rewrite_needed or len(store) > self._saved_length:
+            changed = set(range(len(store.shards)))
+        else:
+            changed = {store.shard_of(row) for row in self._dirty_rows}
+        if not changed:
+            self.saved.emit(True, "No changes to save")
+            return True
+        self._start_rewrite(
+            [
+                (store.filenames[i], store.shards[i])
+                for i in sorted(changed)
+            ],
+            lineterminator,
+        )
+        return True
+
+    def _start_rewrite(self, targets, lineterminator):
+        # Rows are saved in stored order; sorting only affects the view.
+        self._saver = CsvSaver(targets, self._headers, lineterminator, self)
+        self._saver.reopen = self.backend == "mmap"
+        self._saver.finished.connect(self._on_rewrite_finished)
+        self._saver.start()
+
+    def _on_rewrite_finished(self):
+        if self._saver is None:
+            return  # already handled by wait_for_save()
+        saver, self._saver = self._saver, None
+        if saver.error:
+            self.saved.emit(False, f"Could not save: {saver.error}")
+            return
+        if saver.store is not None:
+            # Same rows in the same order, so the view needs no reset
+            building = self._indexer is not None
+            self._stop_indexer()
+            self._data.close()
+            self._data = saver.store
+            if building:
+                self._build_index()
+        self._mark_saved()
+        self.saved.emit(True, f"Saved {self.filename}")
+
+    def _mark_saved(self):
+        self._dirty_rows.clear()
+        self._rewrite_needed = False
+        self._saved_length = len(self._data)
+
+    def wait_for_save(self):
+        """Block until a background save has finished"""
+        if self._save_pending:
+            self.fetch_all()
+            self._save_pending = False
+            self.save_data()
+        if self._saver is not None:
+            self._saver.wait()
+            self._on_rewrite_finished()
 
 
 class MainWindow(qtw.QMainWindow):
@@ -91,16 +1568,49 @@ class MainWindow(qtw.QMainWindow):
         menu = self.menuBar()
         file_menu = menu.addMenu("File")
         file_menu.addAction("Open…", self.select_file)
+        file_menu.addAction("Open Streaming…", self.select_file_streaming)
+        file_menu.addAction("Open Memory-Mapped…", self.select_file_mmap)
+        file_menu.addAction("Open Columnar…", self.select_file_columnar)
+        file_menu.addAction("Open Set…", self.select_file_set)
         file_menu.addAction("Save", self.save_file)
 
         edit_menu = menu.addMenu("Edit")
         edit_menu.addAction("Insert Row Above", self.insert_above)
         edit_menu.addAction("Insert Row Below", self.insert_below)
         edit_menu.addAction("Remove Rows", self.remove_rows)
+
+        # Filter bar
+        filter_bar = self.addToolBar("Filter")
+        self.filter_column = qtw.QComboBox()
+        self.filter_column.addItem("All columns")
+        filter_bar.addWidget(self.filter_column)
+        self.filter_text = qtw.QLineEdit(
+            placeholderText="Filter rows…", clearButtonEnabled=True
+        )
+        filter_bar.addWidget(self.filter_text)
+        self.filter_count = qtw.QLabel()
+        filter_bar.addWidget(self.filter_count)
+        self.filter_text.textChanged.connect(self.apply_filter)
+        self.filter_column.currentIndexChanged.connect(self.apply_filter)
+
+        # Statistics panel
+        self.stats_table = qtw.QTableWidget(columnCount=5)
+        self.stats_table.setHorizontalHeaderLabels(
+            ["Sum", "Min", "Max", "Mean", "Distinct"]
+        )
+        self.stats_table.setEditTriggers(qtw.QAbstractItemView.NoEditTriggers)
+        self.stats_dock = qtw.QDockWidget("Column Statistics")
+        self.stats_dock.setWidget(self.stats_table)
+        self.addDockWidget(qtc.Qt.BottomDockWidgetArea, self.stats_dock)
+        menu.addMenu("View").addAction(self.stats_dock.toggleViewAction())
+        # Statistics are only computed while they can be seen
+        self.stats_dock.visibilityChanged.connect(self.on_stats_visible)
+        self.stats = None
+        self.loader = None
         # End main UI code
         self.show()
 
-    def select_file(self):
+    def select_file(self, streaming=False, backend="list"):
         filename, _ = qtw.QFileDialog.getOpenFileName(
             self,
             "Select a CSV file to open…",
@@ -108,16 +1618,140 @@ class MainWindow(qtw.QMainWindow):
             "CSV Files (*.csv) ;; All Files (*)",
         )
         if filename:
-            self.model = CsvTableModel(filename)
-            self.tableview.setModel(self.model)
-            # self.tableview.resizeColumnsToContents()
-            # self.tableview.resizeRowsToContents()
-            # self.tableview.sortByColumn(0, qtc.Qt.AscendingOrder)
-            # self.model.dataChanged.connect(self.model.save_data)
+            self.set_model(
+                CsvTableModel(filename, streaming=streaming, backend=backend)
+            )
+
+    def set_model(self, model):
+        if getattr(self, "model", None):
+            self.stats.close()
+            self.model.close()
+        self.model = model
+        self.model.saved.connect(self.on_saved)
+        self.model.filtered.connect(
+            lambda count: self.filter_count.setText(f"{count} rows")
+        )
+        self.model.indexing.connect(
+            lambda: self.filter_count.setText("Indexing…")
+        )
+        self.filter_column.blockSignals(True)
+        self.filter_column.clear()
+        self.filter_column.addItem("All columns")
+        self.filter_column.addItems(self.model._headers)
+        self.filter_column.blockSignals(False)
+        # A new file opens unfiltered; filtering would load it all
+        self.filter_text.blockSignals(True)
+        self.filter_text.clear()
+        self.filter_text.blockSignals(False)
+        self.filter_count.clear()
+        self.stats_table.setRowCount(0)
+        self.stats = CsvStatsCollector(self.model, self.model)
+        self.stats.updated.connect(self.show_stats)
+        self.stats.set_active(self.stats_dock.isVisible())
+        self.tableview.setModel(self.model)
+        # self.tableview.resizeColumnsToContents()
+        # self.tableview.resizeRowsToContents()
+        # self.tableview.sortByColumn(0, qtc.Qt.AscendingOrder)
+        # self.model.dataChanged.connect(self.model.save_data)
+
+    def select_file_streaming(self):
+        self.select_file(streaming=True)
+
+    def select_file_mmap(self):
+        self.select_file(backend="mmap")
+
+    def select_file_columnar(self):
+        self.select_file(backend="columnar")
+
+    def select_file_set(self):
+        filenames, _ = qtw.QFileDialog.getOpenFileNames(
+            self,
+            "Select CSV files with the same columns…",
+            qtc.QDir.homePath(),
+            "CSV Files (*.csv) ;; All Files (*)",
+        )
+        if filenames:
+            self.loader = CsvShardLoader(sorted(filenames), self)
+            self.loader.progress.connect(
+                lambda done, total: self.statusBar().showMessage(
+                    f"Loading files: {done}/{total}"
+                )
+            )
+            self.loader.finished.connect(self.on_set_loaded)
+            self.loader.start()
+
+    def on_set_loaded(self):
+        loader, self.loader = self.loader, None
+        if loader.error:
+            self.statusBar().showMessage(f"Could not open set: {loader.error}")
+            return
+        self.set_model(CsvTableModel(
+            loader.filenames,
+            backend="sharded",
+            shards=(loader.headers, loader.shards),
+        ))
+        self.statusBar().showMessage(
+            f"Opened {len(loader.filenames)} files, "
+            f"{self.model.rowCount(None)} rows"
+        )
 
     def save_file(self):
-        if self.model:
-            self.model.save_data()
+        if getattr(self, "model", None):
+            if not self.model.save_data():
+                self.statusBar().showMessage("A save is already running")
+
+    def apply_filter(self):
+        if getattr(self, "model", None):
+            column = self.filter_column.currentIndex() - 1
+            self.model.set_filter(
+                self.filter_text.text(), None if column < 0 else column
+            )
+
+    def on_stats_visible(self, visible):
+        if self.stats is not None:
+            self.stats.set_active(visible)
+
+    def show_stats(self, column):
+        """Show or hide the statistics row for a column"""
+        stats = self.stats.stats.get(column)
+        header = self.model.headerData(
+            column, qtc.Qt.Horizontal, qtc.Qt.DisplayRole
+        )
+        labels = [
+            self.stats_table.verticalHeaderItem(row).text()
+            for row in range(self.stats_table.rowCount())
+        ]
+        if header in labels:
+            row = labels.index(header)
+            if stats is None:
+                self.stats_table.removeRow(row)
+                return
+        elif stats is None:
+            return
+        else:
+            row = self.stats_table.rowCount()
+            self.stats_table.insertRow(row)
+            self.stats_table.setVerticalHeaderItem(
+                row, qtw.QTableWidgetItem(header)
+            )
+        values = [
+            stats.total, stats.minimum, stats.maximum, stats.mean,
+            stats.distinct,
+        ]
+        for i, value in enumerate(values):
+            text = "" if value is None else f"{value:.10g}"
+            self.stats_table.setItem(row, i, qtw.QTableWidgetItem(text))
+
+    def on_saved(self, ok, message):
+        self.statusBar().showMessage(message)
+
+    def closeEvent(self, event):
+        if self.loader is not None:
+            self.loader.wait()
+        if getattr(self, "model", None):
+            self.stats.close()
+            self.model.close()
+        super().closeEvent(event)
 
     def insert_above(self):
         selected = self.tableview.selectedIndexes()
@@ -132,7 +1766,7 @@ class MainWindow(qtw.QMainWindow):
     def remove_rows(self):
         selected = self.tableview.selectedIndexes()
         if selected:
-            self.model.removeRows(selected[0].row(), len(selected), None)
+            self.model.remove_row_set(index.row() for index in selected)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+"""Run SQL queries off the GUI thread"""
+import queue
+from PyQt5 import QtCore as qtc
+from PyQt5 import QtSql as qts
+
+
+class DbWorker(qtc.QThread):
+    """Runs queries on its own connection in a background thread
+
+    submit() queues a statement and returns a request id.  The worker
+    prepares each distinct SQL text once, on the connection the
+    ConnectionPool gives its thread, and sends the rows back (a list of
+    lists) with result_ready, or the error text with failed.  Callbacks
+    passed to submit() are called on the GUI thread.  busy is emitted
+    when the first request is queued and when the last one is answered.
+
+    submit_transaction() runs several statements in one transaction,
+    and answers with the number of rows each one changed.
+    """
+
+    result_ready = qtc.pyqtSignal(int, object)
+    failed = qtc.pyqtSignal(int, str)
+    busy = qtc.pyqtSignal(bool)
+
+    def __init__(self, pool, parent=None):
+        super().__init__(parent)
+        self.pool = pool
+        self._requests = queue.Queue()
+        self._next_id = 0
+        self._callbacks = {}
+        self.result_ready.connect(self._on_result)
+        self.failed.connect(self._on_failed)
+
+    def submit(self, sql, params=None, callback=None, errback=None):
+        """Queue sql with params (a dict or a sequence)
+
+        errback, if given, is called with the error text on failure.
+        """
+        self._next_id += 1
+        if not self._callbacks:
+            self.busy.emit(True)
+        self._callbacks[self._next_id] = (callback, errback)
+        self._requests.put((self._next_id, sql, params))
+        if not self.isRunning():
+            self.start()
+        return self._next_id
+
+    def submit_transaction(self, statements, callback=None, errback=None):
+        """Queue (sql, params) pairs to run in one transaction
+
+        On any error the whole transaction is rolled back.
+        """
+        return self.submit(list(statements), None, callback, errback)
+
+    def stop(self):
+        self._requests.put(None)
+        self.wait()
+
+    def _answered(self, request_id):
+        callbacks = self._callbacks.pop(request_id, (None, None))
+        if not self._callbacks:
+            self.busy.emit(False)
+        return callbacks
+
+    def _on_result(self, request_id, rows):
+        callback, errback = self._answered(request_id)
+        if callback is not None:
+            callback(rows)
+
+    def _on_failed(self, request_id, error):
+        callback, errback = self._answered(request_id)
+        print(f'Query failed: {error}')
+        if errback is not None:
+            errback(error)
+
+    def _exec(self, db, prepared, sql, params):
+        """Run sql on its prepared query; (query, error text)"""
+        query = prepared.get(sql)
+        if query is None:
+            query = qts.QSqlQuery(db)
+            query.setForwardOnly(True)
+            if not query.prepare(sql):
+                return None, query.lastError().text()
+            prepared[sql] = query
+        if isinstance(params, dict):
+            for name, value in params.items():
+                query.bindValue(name, value)
+        else:
+            for value in params or ():
+                query.addBindValue(value)
+        if not query.exec():
+            return None, query.lastError().text()
+        return query, ''
+
+    def _run_transaction(self, db, prepared, request_id, statements):
+        db.transaction()
+        counts = []
+        for sql, params in statements:
+            query, error = self._exec(db, prepared, sql, params)
+            if query is None:
+                db.rollback()
+                self.failed.emit(request_id, error)
+                return
+            counts.append(query.numRowsAffected())
+            query.finish()
+        if not db.commit():
+            db.rollback()
+            self.failed.emit(request_id, db.lastError().text())
+            return
+        self.result_ready.emit(request_id, counts)
+
+    def run(self):
+        db = self.pool.connection()
+        prepared = {}
+        while True:
+            request = self._requests.get()
+            if request is None:
+                break
+            request_id, sql, params = request
+            if isinstance(sql, list):
+                self._run_transaction(db, prepared, request_id, sql)
+                continue
+            query, error = self._exec(db, prepared, sql, params)
+            if query is None:
+                self.failed.emit(request_id, error)
+                continue
+            columns = query.record().count()
+            rows = []
+            while query.next():
+                rows.append([query.value(i) for i in range(columns)])
+            query.finish()
+            self.result_ready.emit(request_id, rows)
+        # The queries must go before the connection can be removed
+        prepared.clear()
+        del db
+        self.pool.release()
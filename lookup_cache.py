@@ -0,0 +1,84 @@
+"""In-memory copies of small lookup tables, shared by the whole process"""
+from PyQt5 import QtCore as qtc
+from PyQt5 import QtSql as qts
+
+
+class LookupTable(qtc.QObject):
+    """A small table (like roasts) held in a dict keyed by its id
+
+    Lookups never touch the database.  refresh() re-reads the table
+    only when it may have changed: after invalidate(), which our own
+    writes to the table should call, or once PRAGMA data_version shows
+    that another connection has committed.  changed is emitted after
+    every re-read.  Use it from the thread that owns db.
+    """
+
+    changed = qtc.pyqtSignal()
+
+    def __init__(self, db, table, columns):
+        super().__init__()
+        self.db = db
+        self.table = table
+        self.columns = list(columns)
+        self.rows = {}
+        self._by_value = {}
+        self._stale = True
+        self._data_version = None
+
+    def invalidate(self):
+        self._stale = True
+
+    def _current_data_version(self):
+        query = qts.QSqlQuery('PRAGMA data_version', self.db)
+        return query.value(0) if query.next() else None
+
+    def refresh(self):
+        """Re-read the table if it may have changed"""
+        version = self._current_data_version()
+        if not self._stale and version == self._data_version:
+            return False
+        query = qts.QSqlQuery(self.db)
+        query.setForwardOnly(True)
+        query.exec(
+            f'SELECT id, {", ".join(self.columns)} '
+            f'FROM {self.table} ORDER BY id')
+        rows = {}
+        while query.next():
+            rows[query.value(0)] = tuple(
+                query.value(i + 1) for i in range(len(self.columns)))
+        self.rows = rows
+        self._by_value.clear()
+        self._stale = False
+        self._data_version = version
+        self.changed.emit()
+        return True
+
+    def value(self, id, column):
+        """column of the row with id, or None if there is no such row"""
+        row = self.rows.get(id)
+        return None if row is None else row[self.columns.index(column)]
+
+    def values(self, column):
+        """column of every row, in id order"""
+        i = self.columns.index(column)
+        return [row[i] for row in self.rows.values()]
+
+    def find(self, column, value):
+        """The id of the row whose column is value, or None"""
+        if column not in self._by_value:
+            i = self.columns.index(column)
+            self._by_value[column] = {
+                row[i]: id for id, row in self.rows.items()}
+        return self._by_value[column].get(value)
+
+
+_tables = {}
+
+
+def lookup_table(db, table, columns):
+    """The process-wide LookupTable of table in db's database file"""
+    key = (db.databaseName(), table)
+    if key not in _tables:
+        _tables[key] = LookupTable(db, table, columns)
+    _tables[key].refresh()
+    return _tables[key]
@@ -0,0 +1,112 @@
+"""Versioned schema migrations for coffee.db
+
+The schema version is kept in PRAGMA user_version.  MIGRATIONS[n - 1]
+holds the statements that take the schema from version n - 1 to n;
+each step runs in its own transaction together with the version bump,
+so a failed step leaves the database at the previous version.
+"""
+from PyQt5 import QtSql as qts
+
+
+MIGRATIONS = [
+    # 1: indexes for looking things up by coffee and by roast
+    [
+        'CREATE INDEX IF NOT EXISTS reviews_coffee_id_review_date '
+        'ON reviews(coffee_id, review_date)',
+        'CREATE INDEX IF NOT EXISTS coffees_roast_id ON coffees(roast_id)',
+    ],
+    # 2: full-text search over coffee names and reviews.  The FTS5
+    # tables index the base tables' text (external content) and the
+    # triggers keep them in step with every insert, update and delete.
+    [
+        "CREATE VIRTUAL TABLE coffees_fts USING fts5("
+        "coffee_brand, coffee_name, content='coffees', content_rowid='id')",
+        "CREATE VIRTUAL TABLE reviews_fts USING fts5("
+        "review, content='reviews', content_rowid='id')",
+        "INSERT INTO coffees_fts(coffees_fts) VALUES ('rebuild')",
+        "INSERT INTO reviews_fts(reviews_fts) VALUES ('rebuild')",
+        'CREATE TRIGGER coffees_fts_insert AFTER INSERT ON coffees BEGIN '
+        'INSERT INTO coffees_fts(rowid, coffee_brand, coffee_name) '
+        'VALUES (new.id, new.coffee_brand, new.coffee_name); END',
+        'CREATE TRIGGER coffees_fts_delete AFTER DELETE ON coffees BEGIN '
+        'INSERT INTO coffees_fts(coffees_fts, rowid, coffee_brand, '
+        "coffee_name) VALUES ('delete', old.id, old.coffee_brand, "
+        'old.coffee_name); END',
+        'CREATE TRIGGER coffees_fts_update '
+        'AFTER UPDATE OF coffee_brand, coffee_name ON coffees BEGIN '
+        'INSERT INTO coffees_fts(coffees_fts, rowid, coffee_brand, '
+        "coffee_name) VALUES ('delete', old.id, old.coffee_brand, "
+        'old.coffee_name); '
+        'INSERT INTO coffees_fts(rowid, coffee_brand, coffee_name) '
+        'VALUES (new.id, new.coffee_brand, new.coffee_name); END',
+        'CREATE TRIGGER reviews_fts_insert AFTER INSERT ON reviews BEGIN '
+        'INSERT INTO reviews_fts(rowid, review) '
+        'VALUES (new.id, new.review); END',
+        'CREATE TRIGGER reviews_fts_delete AFTER DELETE ON reviews BEGIN '
+        'INSERT INTO reviews_fts(reviews_fts, rowid, review) '
+        "VALUES ('delete', old.id, old.review); END",
+        'CREATE TRIGGER reviews_fts_update '
+        'AFTER UPDATE OF review ON reviews BEGIN '
+        'INSERT INTO reviews_fts(reviews_fts, rowid, review) '
+        "VALUES ('delete', old.id, old.review); "
+        'INSERT INTO reviews_fts(rowid, review) '
+        'VALUES (new.id, new.review); END',
+    ],
+]
+
+# What sqlite_master must list once the migrations have run
+REQUIRED_SCHEMA = {
+    ('table', 'roasts'),
+    ('table', 'coffees'),
+    ('table', 'reviews'),
+    ('index', 'reviews_coffee_id_review_date'),
+    ('index', 'coffees_roast_id'),
+    ('table', 'coffees_fts'),
+    ('table', 'reviews_fts'),
+    ('trigger', 'coffees_fts_insert'),
+    ('trigger', 'coffees_fts_delete'),
+    ('trigger', 'coffees_fts_update'),
+    ('trigger', 'reviews_fts_insert'),
+    ('trigger', 'reviews_fts_delete'),
+    ('trigger', 'reviews_fts_update'),
+}
+
+
+def schema_version(db):
+    query = qts.QSqlQuery('PRAGMA user_version', db)
+    return query.value(0) if query.next() else 0
+
+
+def migrate(db):
+    """Run the migrations db has not had yet
+
+    Returns an error message, or an empty string on success.
+    """
+    version = schema_version(db)
+    if version > len(MIGRATIONS):
+        return (f'Database schema version {version} is newer than '
+                f'this program ({len(MIGRATIONS)})')
+    query = qts.QSqlQuery(db)
+    for number, statements in enumerate(
+            MIGRATIONS[version:], version + 1):
+        db.transaction()
+        for statement in statements + [f'PRAGMA user_version = {number}']:
+            if not query.exec(statement):
+                error = query.lastError().text()
+                db.rollback()
+                return f'Migration {number} failed: {error}'
+        db.commit()
+    return ''
+
+
+def check_schema(db):
+    """The required tables and indexes missing from db
+
+    Only sqlite_master is read, never the data itself, so this costs
+    the same however big the database is.
+    """
+    query = qts.QSqlQuery('SELECT type, name FROM sqlite_master', db)
+    found = set()
+    while query.next():
+        found.add((query.value(0), query.value(1)))
+    return REQUIRED_SCHEMA - found
@@ -0,0 +1,236 @@
+"""Opt-in profiling of the SQL the coffee apps run
+
+Set COFFEE_SQL_PROFILE=1 to turn it on.  COFFEE_SQL_SLOW_MS sets the
+threshold above which a statement is reported as slow (default 50),
+and COFFEE_SQL_EXPLAIN=1 also captures the EXPLAIN QUERY PLAN of every
+slow statement.
+
+Profiling works by wrapping QSqlQuery.exec(), execBatch() and next(),
+so every query the models, the worker and the windows run is timed
+without changing them.  Only exec time is measured; rows are counted
+as they are fetched.
+"""
+import os
+import time
+import threading
+from collections import deque
+from PyQt5 import QtWidgets as qtw
+from PyQt5 import QtCore as qtc
+from PyQt5 import QtSql as qts
+
+
+class QueryRecord:
+    """One executed statement"""
+
+    __slots__ = (
+        'sql', 'values', 'batch', 'rows', 'seconds', 'thread', 'plan')
+
+    def __init__(self, sql, values, seconds, batch=None):
+        self.sql = sql
+        self.values = values
+        # For execBatch(), how many rows of values were bound; values
+        # then only holds the first of them
+        self.batch = batch
+        self.rows = 0
+        self.seconds = seconds
+        # Qt's threads are all "Dummy-n" to threading, so name them by
+        # their QThread subclass (DbWorker, ...)
+        if threading.current_thread() is threading.main_thread():
+            self.thread = 'main'
+        else:
+            self.thread = type(qtc.QThread.currentThread()).__name__
+        self.plan = None
+
+
+class SqlProfiler:
+    """Keeps the last size executed statements in a ring buffer
+
+    install() wraps QSqlQuery for the whole process; uninstall() puts
+    the original methods back.  Statements slower than slow_ms are
+    printed and, with explain, their query plan is captured on the
+    connection the pool gives the thread that ran them.
+    """
+
+    def __init__(self, pool=None, size=1000, slow_ms=50, explain=False):
+        self.pool = pool
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.records = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._originals = {}
+        # The unwrapped methods, for query_plan() to run its own
+        # statements without recording them
+        self._exec = qts.QSqlQuery.exec
+        self._next = qts.QSqlQuery.next
+
+    def install(self):
+        if self._originals:
+            return
+        # uninstall() must put back the method descriptors from the class
+        # dict; getattr() gives unbound builtins, which are only good for
+        # calling and no longer bind to instances once restored
+        for name in ('exec', 'exec_', 'execBatch', 'next'):
+            self._originals[name] = vars(qts.QSqlQuery)[name]
+        exec_ = self._exec = qts.QSqlQuery.exec
+        exec_batch = qts.QSqlQuery.execBatch
+        next_ = self._next = qts.QSqlQuery.next
+        profiler = self
+
+        def timed_exec(query, *args):
+            start = time.perf_counter()
+            ok = exec_(query, *args)
+            profiler._record(query, time.perf_counter() - start, ok)
+            return ok
+
+        def timed_exec_batch(query, *args):
+            start = time.perf_counter()
+            ok = exec_batch(query, *args)
+            profiler._record(
+                query, time.perf_counter() - start, ok, batch=True)
+            return ok
+
+        def counted_next(query):
+            ok = next_(query)
+            record = getattr(query, '_profile_record', None)
+            if ok and record is not None:
+                record.rows += 1
+            return ok
+
+        qts.QSqlQuery.exec = timed_exec
+        qts.QSqlQuery.exec_ = timed_exec
+        qts.QSqlQuery.execBatch = timed_exec_batch
+        qts.QSqlQuery.next = counted_next
+
+    def uninstall(self):
+        for name, method in self._originals.items():
+            setattr(qts.QSqlQuery, name, method)
+        self._originals.clear()
+
+    def _record(self, query, seconds, ok, batch=False):
+        values = dict(query.boundValues())
+        if batch:
+            # Each value is a list with one entry per row of the batch;
+            # keep only the first row rather than the whole batch
+            size = len(next(iter(values.values()), []))
+            record = QueryRecord(
+                query.lastQuery(),
+                {name: column[:1] for name, column in values.items()},
+                seconds, size)
+            if ok:
+                # numRowsAffected() only counts the last row's statement
+                record.rows = size
+        else:
+            record = QueryRecord(query.lastQuery(), values, seconds)
+            if ok and not query.isSelect():
+                record.rows = query.numRowsAffected()
+        query._profile_record = record
+        with self._lock:
+            self.records.append(record)
+        if seconds * 1000 >= self.slow_ms:
+            print(f'Slow query ({seconds * 1000:.1f} ms): {record.sql} '
+                  f'{describe_values(record)}')
+            if self.explain:
+                record.plan = self.query_plan(
+                    record.sql, len(record.values))
+
+    def query_plan(self, sql, parameters=0):
+        """EXPLAIN QUERY PLAN of sql, one line per step
+
+        Every placeholder is bound to NULL, which leaves the plan
+        unchanged; parameters is how many positional (?) ones sql has.
+        """
+        if self.pool is None or not sql.lstrip().upper().startswith(
+                ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')):
+            return None
+        query = qts.QSqlQuery(self.pool.connection())
+        if not query.prepare(f'EXPLAIN QUERY PLAN {sql}'):
+            return f'No plan: {query.lastError().text()}'
+        # Only named placeholders are listed once prepared
+        named = query.boundValues()
+        if named:
+            for name in named:
+                query.bindValue(name, None)
+        else:
+            for _ in range(parameters):
+                query.addBindValue(None)
+        if not self._exec(query):
+            return f'No plan: {query.lastError().text()}'
+        steps = []
+        while self._next(query):
+            steps.append(query.value(3))
+        return '\n'.join(steps)
+
+    def slowest(self, count=20):
+        with self._lock:
+            records = list(self.records)
+        return sorted(records, key=lambda r: r.seconds, reverse=True)[:count]
+
+
+def describe_values(record, limit=200):
+    """record's bound values as text of at most limit characters"""
+    if not record.values:
+        return ''
+    text = str(record.values)
+    if len(text) > limit:
+        text = text[:limit - 3] + '...'
+    if record.batch is not None:
+        text = f'{text} (first of {record.batch} rows)'
+    return text
+
+
+def from_environment(pool=None):
+    """An installed SqlProfiler if COFFEE_SQL_PROFILE is set, else None"""
+    if not os.environ.get('COFFEE_SQL_PROFILE'):
+        return None
+    profiler = SqlProfiler(
+        pool,
+        slow_ms=float(os.environ.get('COFFEE_SQL_SLOW_MS', 50)),
+        explain=bool(os.environ.get('COFFEE_SQL_EXPLAIN')))
+    profiler.install()
+    return profiler
+
+
+class SqlProfilerPanel(qtw.QDockWidget):
+    """Dock widget listing the slowest statements seen so far
+
+    The list is refreshed once a second while the dock is visible;
+    hovering a statement shows its bound values and query plan.
+    """
+
+    def __init__(self, profiler, count=20, parent=None):
+        super().__init__('Slowest SQL', parent)
+        self.profiler = profiler
+        self.count = count
+        self.table = qtw.QTableWidget(columnCount=4)
+        self.table.setHorizontalHeaderLabels(
+            ['ms', 'Rows', 'Thread', 'Statement'])
+        self.table.horizontalHeader().setSectionResizeMode(
+            3, qtw.QHeaderView.Stretch)
+        self.table.setEditTriggers(qtw.QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        self.setWidget(self.table)
+        self.timer = qtc.QTimer(self, interval=1000)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+
+    def refresh(self):
+        if not self.isVisible():
+            return
+        records = self.profiler.slowest(self.count)
+        self.table.setRowCount(len(records))
+        for row, record in enumerate(records):
+            texts = [
+                f'{record.seconds * 1000:.2f}', str(record.rows),
+                record.thread, ' '.join(record.sql.split()),
+            ]
+            tooltip = '\n\n'.join(
+                part for part in (
+                    record.sql,
+                    f'Values: {describe_values(record)}'
+                    if record.values else '',
+                    record.plan or '',
+                ) if part)
+            for column, text in enumerate(texts):
+                item = qtw.QTableWidgetItem(text)
+                item.setToolTip(tooltip)
+                self.table.setItem(row, column, item)
@@ -0,0 +1,80 @@
+"""Tests for csv_editor.CsvTableModel; run with pytest"""
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5 import QtCore as qtc
+
+import csv_editor
+
+app = qtc.QCoreApplication.instance() or qtc.QCoreApplication([])
+
+
+def write_csv(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_columnar_column_turns_text_after_first_chunk(tmp_path):
+    lines = ["id,value"] + [f"{i},{i * 2}" for i in range(2000)]
+    lines[1501] = "1500,oops"
+    model = csv_editor.CsvTableModel(
+        write_csv(tmp_path / "mixed.csv", lines), backend="columnar",
+        chunk_size=1000,
+    )
+    try:
+        assert model.rowCount(None) == 2000
+        assert model._data.kinds[1] == "str"
+        assert model.index(1500, 1).data() == "oops"
+        assert model.index(1999, 1).data() == "3998"
+    finally:
+        model.close()
+
+
+def test_columnar_header_only_file_sorts(tmp_path):
+    model = csv_editor.CsvTableModel(
+        write_csv(tmp_path / "empty.csv", ["id,value"]), backend="columnar",
+    )
+    try:
+        model.sort(0, qtc.Qt.AscendingOrder)
+        assert model.rowCount(None) == 0
+        assert list(model._data.column(1)) == []
+        model.insertRows(0, 1, None)
+        assert model.index(0, 0).data() == ""
+    finally:
+        model.close()
+
+
+def wait_for_index(model):
+    while model._indexer is not None:
+        model._indexer.wait()
+        app.processEvents()
+
+
+def test_filter_keeps_descending_sort_after_insert(tmp_path):
+    lines = ["id,name"] + [f"{i},row {i}" for i in range(10)]
+    model = csv_editor.CsvTableModel(write_csv(tmp_path / "ten.csv", lines))
+    try:
+        model.sort(0, qtc.Qt.DescendingOrder)
+        model.insertRows(0, 1, None)
+        model.set_filter("row")
+        wait_for_index(model)
+        ids = [model.index(i, 0).data() for i in range(model.rowCount(None))]
+        assert ids == [str(i) for i in reversed(range(10))]
+    finally:
+        model.close()
+
+
+def test_edit_during_indexing_is_searchable(tmp_path):
+    lines = ["id,name"] + [f"{i},row {i}" for i in range(10)]
+    model = csv_editor.CsvTableModel(write_csv(tmp_path / "ten.csv", lines))
+    try:
+        model.set_filter("zzz")
+        # Let the builder index every row before the edit
+        model._indexer.wait()
+        model.setData(model.index(0, 1), "zzz", qtc.Qt.EditRole)
+        wait_for_index(model)
+        assert model.rowCount(None) == 1
+        assert model.index(0, 1).data() == "zzz"
+    finally:
+        model.close()